@@ -0,0 +1,27 @@
+"""add note owner keyset index
+
+Revision ID: 3f1b2c9d8e7a
+Revises: 857c7201a9c7
+Create Date: 2026-10-17 09:12:41.518203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1b2c9d8e7a'
+down_revision: Union[str, Sequence[str], None] = '857c7201a9c7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_note_owner_id_id ON note (owner_id, id);")
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_note_owner_id_id;")
@@ -0,0 +1,91 @@
+"""partition refreshtoken by expiry
+
+Revision ID: 5e9b7c3a1d64
+Revises: d2c5a8f41e97
+Create Date: 2026-10-17 16:41:08.227951
+
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e9b7c3a1d64'
+down_revision: Union[str, Sequence[str], None] = 'd2c5a8f41e97'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Covers the longest refresh token lifetime we ship with plus some slack;
+# the maintenance task keeps creating partitions ahead from here on
+WEEKS_AHEAD = 8
+
+COLUMNS = "id, user_id, jti, family_id, expires_at, is_used"
+
+
+def upgrade() -> None:
+    # Only live tokens are carried over, so the copy is small and runs under a short lock
+    op.execute("LOCK TABLE refreshtoken IN ACCESS EXCLUSIVE MODE;")
+    op.execute("ALTER TABLE refreshtoken RENAME TO refreshtoken_old;")
+
+    op.execute("""
+        CREATE TABLE refreshtoken (
+            id INTEGER NOT NULL DEFAULT nextval('refreshtoken_id_seq'),
+            user_id INTEGER NOT NULL,
+            jti VARCHAR NOT NULL,
+            family_id VARCHAR NOT NULL,
+            expires_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            is_used BOOLEAN NOT NULL,
+            CONSTRAINT refreshtoken_part_pkey PRIMARY KEY (id, expires_at),
+            CONSTRAINT refreshtoken_jti_expires_at_key UNIQUE (jti, expires_at)
+        ) PARTITION BY RANGE (expires_at);
+    """)
+    op.execute("CREATE TABLE refreshtoken_default PARTITION OF refreshtoken DEFAULT;")
+
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+    week = today - timedelta(days=today.weekday())
+    for _ in range(WEEKS_AHEAD + 1):
+        end = week + timedelta(weeks=1)
+        op.execute(
+            f"CREATE TABLE refreshtoken_p{week:%Y%m%d} PARTITION OF refreshtoken "
+            f"FOR VALUES FROM ('{week:%Y-%m-%d}') TO ('{end:%Y-%m-%d}');"
+        )
+        week = end
+
+    op.execute(f"INSERT INTO refreshtoken ({COLUMNS}) SELECT {COLUMNS} FROM refreshtoken_old WHERE expires_at > now() AT TIME ZONE 'utc';")
+
+    op.execute("ALTER SEQUENCE refreshtoken_id_seq OWNED BY refreshtoken.id;")
+    op.execute("DROP TABLE refreshtoken_old;")
+
+    op.execute("ALTER TABLE refreshtoken RENAME CONSTRAINT refreshtoken_part_pkey TO refreshtoken_pkey;")
+    op.create_index(op.f('ix_refreshtoken_user_id'), 'refreshtoken', ['user_id'], unique=False)
+    op.create_index(op.f('ix_refreshtoken_family_id'), 'refreshtoken', ['family_id'], unique=False)
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE refreshtoken RENAME TO refreshtoken_part;")
+    op.execute("ALTER INDEX ix_refreshtoken_user_id RENAME TO ix_refreshtoken_part_user_id;")
+    op.execute("ALTER INDEX ix_refreshtoken_family_id RENAME TO ix_refreshtoken_part_family_id;")
+    op.execute("ALTER TABLE refreshtoken_part RENAME CONSTRAINT refreshtoken_pkey TO refreshtoken_part_pkey;")
+
+    op.execute("""
+        CREATE TABLE refreshtoken (
+            id INTEGER NOT NULL DEFAULT nextval('refreshtoken_id_seq'),
+            user_id INTEGER NOT NULL,
+            jti VARCHAR NOT NULL,
+            family_id VARCHAR NOT NULL,
+            expires_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            is_used BOOLEAN NOT NULL,
+            CONSTRAINT refreshtoken_pkey PRIMARY KEY (id),
+            CONSTRAINT refreshtoken_jti_key UNIQUE (jti)
+        );
+    """)
+    op.execute(f"INSERT INTO refreshtoken ({COLUMNS}) SELECT {COLUMNS} FROM refreshtoken_part;")
+
+    op.execute("ALTER SEQUENCE refreshtoken_id_seq OWNED BY refreshtoken.id;")
+    op.execute("DROP TABLE refreshtoken_part;")
+
+    op.create_index(op.f('ix_refreshtoken_user_id'), 'refreshtoken', ['user_id'], unique=False)
+    op.create_index(op.f('ix_refreshtoken_family_id'), 'refreshtoken', ['family_id'], unique=False)
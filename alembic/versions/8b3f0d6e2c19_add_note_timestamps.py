@@ -0,0 +1,38 @@
+"""add note timestamps
+
+Revision ID: 8b3f0d6e2c19
+Revises: 5e9b7c3a1d64
+Create Date: 2026-10-17 17:26:53.610482
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b3f0d6e2c19'
+down_revision: Union[str, Sequence[str], None] = '5e9b7c3a1d64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # now() is evaluated once and stored as the column's missing value, so existing
+    # rows are backfilled without rewriting the table. They all share the migration
+    # time, which keeps their relative feed order on the id tiebreaker.
+    op.execute("ALTER TABLE note ADD COLUMN created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT timezone('utc', now());")
+    op.execute("ALTER TABLE note ADD COLUMN updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT timezone('utc', now());")
+
+    with op.get_context().autocommit_block():
+        op.execute("""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_note_public_feed
+            ON note (created_at DESC, id DESC) WHERE is_public;
+        """)
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_note_public_feed;")
+    op.execute("ALTER TABLE note DROP COLUMN updated_at;")
+    op.execute("ALTER TABLE note DROP COLUMN created_at;")
@@ -0,0 +1,75 @@
+"""add stored search vector
+
+Revision ID: a7d4e2f10b35
+Revises: 3f1b2c9d8e7a
+Create Date: 2026-10-17 10:04:27.903114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d4e2f10b35'
+down_revision: Union[str, Sequence[str], None] = '3f1b2c9d8e7a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 10000
+
+# Title outranks content; private (encrypted) notes are never searched so they get no vector
+SEARCH_VECTOR_EXPR = """
+    CASE WHEN {row}.is_public THEN
+        setweight(to_tsvector('english', coalesce({row}.title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce({row}.content, '')), 'B')
+    END
+"""
+
+
+def upgrade() -> None:
+    # A GENERATED ... STORED column would rewrite the whole table under an exclusive lock,
+    # so the column is kept up to date by a trigger and existing rows are backfilled in batches.
+    op.execute("ALTER TABLE note ADD COLUMN search_vector tsvector;")
+    op.execute(f"""
+        CREATE FUNCTION note_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := {SEARCH_VECTOR_EXPR.format(row="NEW")};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER note_search_vector_trigger
+        BEFORE INSERT OR UPDATE OF title, content, is_public ON note
+        FOR EACH ROW EXECUTE FUNCTION note_search_vector_update();
+    """)
+
+    with op.get_context().autocommit_block():
+        conn = op.get_bind()
+        min_id, max_id = conn.execute(sa.text("SELECT min(id), max(id) FROM note")).one()
+
+        if min_id is not None:
+            for start in range(min_id, max_id + 1, BATCH_SIZE):
+                conn.execute(
+                    sa.text(f"""
+                        UPDATE note SET search_vector = {SEARCH_VECTOR_EXPR.format(row="note")}
+                        WHERE id >= :start AND id < :end AND is_public
+                    """),
+                    {"start": start, "end": start + BATCH_SIZE},
+                )
+
+        op.execute("CREATE INDEX CONCURRENTLY ix_note_search_vector ON note USING GIN (search_vector);")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_note_content_fts;")
+
+def downgrade() -> None:
+    op.execute("""
+        CREATE INDEX ix_note_content_fts ON note 
+        USING GIN (to_tsvector('english', coalesce(title, '') || ' ' || coalesce(content, '')));
+    """)
+    op.execute("DROP INDEX IF EXISTS ix_note_search_vector;")
+    op.execute("DROP TRIGGER IF EXISTS note_search_vector_trigger ON note;")
+    op.execute("DROP FUNCTION IF EXISTS note_search_vector_update();")
+    op.execute("ALTER TABLE note DROP COLUMN search_vector;")
@@ -0,0 +1,32 @@
+"""add note binary ciphertext
+
+Revision ID: c3a9f1e7b254
+Revises: 8b3f0d6e2c19
+Create Date: 2026-10-17 19:12:40.518306
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3a9f1e7b254'
+down_revision: Union[str, Sequence[str], None] = '8b3f0d6e2c19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Nullable columns without a default are a catalog-only change. Existing private
+    # notes are converted afterwards, in batches and with the app online, by
+    # `python -m app.reencrypt` (it needs ENCRYPTION_KEY, which migrations don't have).
+    op.add_column('note', sa.Column('title_enc', sa.LargeBinary(), nullable=True))
+    op.add_column('note', sa.Column('content_enc', sa.LargeBinary(), nullable=True))
+
+def downgrade() -> None:
+    # Run only once no row uses the new columns: their ciphertext would be lost
+    op.drop_column('note', 'content_enc')
+    op.drop_column('note', 'title_enc')
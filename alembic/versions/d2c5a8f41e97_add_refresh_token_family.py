@@ -0,0 +1,33 @@
+"""add refresh token family
+
+Revision ID: d2c5a8f41e97
+Revises: a7d4e2f10b35
+Create Date: 2026-10-17 15:02:27.904316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2c5a8f41e97'
+down_revision: Union[str, Sequence[str], None] = 'a7d4e2f10b35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('refreshtoken', sa.Column('family_id', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+    # Tokens issued before families existed each become a family of their own
+    op.execute("UPDATE refreshtoken SET family_id = jti WHERE family_id IS NULL;")
+    op.alter_column('refreshtoken', 'family_id', nullable=False)
+
+    with op.get_context().autocommit_block():
+        op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_refreshtoken_family_id ON refreshtoken (family_id);")
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_refreshtoken_family_id;")
+    op.drop_column('refreshtoken', 'family_id')
@@ -0,0 +1,38 @@
+"""add note search tokens
+
+Revision ID: e61b4d8a9f03
+Revises: c3a9f1e7b254
+Create Date: 2026-10-17 20:41:08.263917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e61b4d8a9f03'
+down_revision: Union[str, Sequence[str], None] = 'c3a9f1e7b254'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # New and empty, so the GIN index can be built inline; existing private notes
+    # are indexed afterwards by `python -m app.search_index` (it needs the keys)
+    op.create_table(
+        'notesearchtoken',
+        sa.Column('note_id', sa.Integer(), nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('tokens', postgresql.ARRAY(sa.Text()), nullable=False),
+        sa.ForeignKeyConstraint(['note_id'], ['note.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('note_id'),
+    )
+    op.create_index('ix_notesearchtoken_tokens', 'notesearchtoken', ['tokens'], unique=False, postgresql_using='gin')
+
+def downgrade() -> None:
+    op.drop_index('ix_notesearchtoken_tokens', table_name='notesearchtoken', postgresql_using='gin')
+    op.drop_table('notesearchtoken')
@@ -0,0 +1,30 @@
+"""add search token key id
+
+Revision ID: f4c2a7d91b6e
+Revises: e61b4d8a9f03
+Create Date: 2026-10-17 22:05:31.804126
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4c2a7d91b6e'
+down_revision: Union[str, Sequence[str], None] = 'e61b4d8a9f03'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # A constant default is stored as the missing value, no table rewrite. 0 is never
+    # a key id, so `python -m app.search_index` rebuilds the existing rows once; until
+    # then they still match queries if the key hasn't changed.
+    op.add_column('notesearchtoken', sa.Column('key_id', sa.Integer(), nullable=False, server_default='0'))
+    op.alter_column('notesearchtoken', 'key_id', server_default=None)
+
+def downgrade() -> None:
+    op.drop_column('notesearchtoken', 'key_id')
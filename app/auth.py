@@ -1,7 +1,6 @@
 import os
 import uuid
-from typing import Dict, Any
-from passlib.context import CryptContext
+from typing import AsyncGenerator, Dict, Any, Tuple
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 
@@ -9,19 +8,19 @@ from jose import JWTError, jwt
 from sqlmodel.ext.asyncio.session import AsyncSession
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import Depends, HTTPException, status
+from sqlalchemy.orm import sessionmaker
 
 from .database import get_session
-from . import crud, models
+from . import crud, database, models, hashing, redis_client
+from .principal_cache import principal_cache
 from .config import settings
 
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return await hashing.verify_and_update(plain_password, hashed_password)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+async def get_password_hash(password: str) -> str:
+    return await hashing.hash_password(password)
 
 def create_refresh_token_jti() -> str:
     return str(uuid.uuid4())
@@ -56,9 +55,21 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
 
 
-async def get_current_user(
-    session: AsyncSession = Depends(get_session), token: str = Depends(oauth2_scheme)
-) -> models.User:
+def _primary_pin_key(subject: str) -> str:
+    return f"primary_pin:{subject}"
+
+async def pin_to_primary(subject: str):
+    # Read-your-writes: replicas may lag, so send this user's reads to the primary for a while
+    if database.replica_engines:
+        redis = redis_client.get_redis_pool()
+        await redis.set(_primary_pin_key(subject), 1, ex=settings.READ_YOUR_WRITES_SECONDS)
+
+async def is_pinned_to_primary(subject: str) -> bool:
+    redis = redis_client.get_redis_pool()
+    return bool(await redis.exists(_primary_pin_key(subject)))
+
+
+async def get_token_subject(token: str = Depends(oauth2_scheme)) -> str:
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         email: str = payload.get("sub")
@@ -76,9 +87,36 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    return email
+
+
+async def get_read_session(
+    session: AsyncSession = Depends(get_session), email: str = Depends(get_token_subject)
+) -> AsyncGenerator[AsyncSession, None]:
+    """A session on a read replica, or the primary one if there are no replicas or the user just wrote."""
+    read_engine = database.get_read_engine()
+    if read_engine is None or await is_pinned_to_primary(email):
+        yield session
+        return
+
+    async_session = sessionmaker(bind=read_engine, class_=AsyncSession, expire_on_commit=False)
+    async with async_session() as read_session:
+        yield read_session
+
+
+async def get_current_user(
+    session: AsyncSession = Depends(get_read_session), email: str = Depends(get_token_subject)
+) -> models.User:
+    user = principal_cache.get(email)
+    if user is not None:
+        return user
+
+    version = principal_cache.version
     user = await crud.get_user_by_email(session, email=email)
 
     if user is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found.")
         
+    # Cache a detached copy: the loaded instance belongs to this request's session
+    principal_cache.set(email, models.User.model_validate(user.model_dump()), version)
     return user
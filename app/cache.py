@@ -0,0 +1,220 @@
+import asyncio
+import math
+import random
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from . import cache_codec, invalidation, redis_client
+from .metrics import CACHE_REQUESTS, cache_family
+from .config import settings
+from .local_cache import LocalCache
+
+# Entries are Redis hashes: v = payload (see cache_codec), exp = logical expiry (epoch seconds),
+# delta = how long the last rebuild took. The key itself lives CACHE_STALE_SECONDS
+# past its logical expiry so readers can be served stale data while one worker rebuilds.
+#
+# Every cache family (e.g. "public_notes_feed") has a generation counter "gen:<family>";
+# the live entry is "<family>:<generation>". Invalidating is a single atomic INCR, so a
+# rebuild that raced with a write lands on a key nobody reads anymore.
+
+GENERATION_TTL_SECONDS = 24 * 60 * 60
+
+READ_SCRIPT = """
+local generation = redis.call('get', KEYS[1]) or '0'
+local entry = redis.call('hmget', KEYS[2] .. ':' .. generation, 'v', 'exp', 'delta')
+return {generation, entry[1], entry[2], entry[3]}
+"""
+
+STORE_IF_ABSENT_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('hset', KEYS[1], 'v', ARGV[1], 'exp', ARGV[2], 'delta', ARGV[3])
+redis.call('expire', KEYS[1], ARGV[4])
+return 1
+"""
+
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+INVALIDATION_CHANNEL = "cache_invalidations"
+
+# In-process request coalescing: one rebuild task per key per worker
+_inflight: Dict[str, asyncio.Task] = {}
+
+# Optional L1 in front of Redis for families every user reads (the public feed).
+# Entries are dropped on the family's generation bump via pub/sub; the short TTL
+# bounds staleness if a message is ever lost.
+l1: LocalCache[bytes] = LocalCache(
+    max_entries=settings.CACHE_L1_MAX_ENTRIES,
+    ttl_seconds=settings.CACHE_L1_TTL_SECONDS,
+)
+
+# Families read through the L1. Only their invalidations are broadcast to the other
+# workers, so writes to per-user families don't churn every process's L1.
+_local_families: Set[str] = set()
+
+invalidation.subscribe(INVALIDATION_CHANNEL, l1.discard, l1.clear)
+
+
+def register_local(family: str):
+    """Serve `family` through the per-process L1 in every worker."""
+    _local_families.add(family)
+
+
+def _lock_key(key: str) -> str:
+    return f"lock:{key}"
+
+def _generation_key(family: str) -> str:
+    return f"gen:{family}"
+
+
+async def current_key(family: str) -> str:
+    redis = redis_client.get_redis_pool()
+    generation = await redis.get(_generation_key(family)) or b"0"
+    return f"{family}:{generation.decode()}"
+
+
+async def _read(family: str) -> Tuple[str, Optional[bytes], bool]:
+    redis = redis_client.get_redis_pool()
+    generation, raw, expiry, delta = await redis.eval(READ_SCRIPT, 2, _generation_key(family), family)
+    key = f"{family}:{generation.decode()}"
+    value = cache_codec.decode(raw)
+    if value is None:
+        return key, None, True
+
+    # Probabilistic early refresh (XFetch): the closer to expiry and the slower the
+    # rebuild, the more likely a reader volunteers to rebuild before the key goes cold.
+    early = float(delta) * settings.CACHE_EARLY_REFRESH_BETA * -math.log(1.0 - random.random())
+    return key, value, time.time() + early >= float(expiry)
+
+
+async def store(key: str, value: bytes, ttl: int, delta: float = 0.0):
+    redis = redis_client.get_redis_pool()
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.hset(key, mapping={"v": cache_codec.encode(value), "exp": time.time() + ttl, "delta": delta})
+        pipe.expire(key, ttl + settings.CACHE_STALE_SECONDS)
+        await pipe.execute()
+
+
+async def _rebuild(key: str, ttl: int, compute: Callable[[], Awaitable[bytes]], stale: Optional[bytes]) -> bytes:
+    redis = redis_client.get_redis_pool()
+    token = str(uuid.uuid4())
+    lock_key = _lock_key(key)
+
+    if await redis.set(lock_key, token, nx=True, px=settings.CACHE_LOCK_TIMEOUT_MS):
+        try:
+            start = time.monotonic()
+            value = await compute()
+            await store(key, value, ttl, time.monotonic() - start)
+            return value
+        finally:
+            await redis.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+
+    # Another worker holds the lock: serve what we have, or wait for it to fill the key
+    if stale is not None:
+        return stale
+
+    deadline = time.monotonic() + settings.CACHE_LOCK_TIMEOUT_MS / 1000
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.02)
+        value = cache_codec.decode(await redis.hget(key, "v"))
+        if value is not None:
+            return value
+        if not await redis.exists(lock_key):
+            break
+
+    return await compute()
+
+
+async def get_or_compute(
+    family: str,
+    ttl: int,
+    compute: Callable[[], Awaitable[bytes]],
+) -> bytes:
+    if family not in _local_families:
+        return await _get_or_compute(family, ttl, compute)
+
+    value = l1.get(family)
+    if value is not None:
+        CACHE_REQUESTS.labels(cache_family(family), "local_hit").inc()
+        return value
+
+    version = l1.version
+    value = await _get_or_compute(family, ttl, compute)
+    l1.set(family, value, version)
+    return value
+
+
+async def _get_or_compute(family: str, ttl: int, compute: Callable[[], Awaitable[bytes]]) -> bytes:
+    key, value, needs_refresh = await _read(family)
+    if not needs_refresh:
+        CACHE_REQUESTS.labels(cache_family(family), "hit").inc()
+        return value
+
+    task = _inflight.get(key)
+    if task is None:
+        CACHE_REQUESTS.labels(cache_family(family), "miss" if value is None else "refresh").inc()
+        task = asyncio.create_task(_rebuild(key, ttl, compute, value))
+        _inflight[key] = task
+        task.add_done_callback(lambda done: _inflight.pop(key) if _inflight.get(key) is done else None)
+    elif value is not None:
+        # A rebuild is already running in this worker, don't wait for it
+        CACHE_REQUESTS.labels(cache_family(family), "stale").inc()
+        return value
+    else:
+        CACHE_REQUESTS.labels(cache_family(family), "coalesced").inc()
+
+    return await asyncio.shield(task)
+
+
+async def invalidate(family: str) -> int:
+    redis = redis_client.get_redis_pool()
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.incr(_generation_key(family))
+        pipe.expire(_generation_key(family), GENERATION_TTL_SECONDS)
+        generation, _ = await pipe.execute()
+
+    if family in _local_families:
+        l1.discard(family)
+        await invalidation.publish(INVALIDATION_CHANNEL, family)
+    return generation
+
+
+async def write_through(family: str, update: Callable[[bytes], Optional[bytes]]):
+    """Bump the family's generation and carry the previous entry over with `update` applied.
+
+    Call after the write is committed. A reader that rebuilt from an older snapshot
+    wrote to the previous generation, and a newer rebuild of this generation wins over
+    the copy (store-if-absent), so the new entry never goes backwards. `update` may
+    return None to leave the new generation empty.
+    """
+    generation = await invalidate(family)
+
+    redis = redis_client.get_redis_pool()
+    raw, expiry, delta = await redis.hmget(f"{family}:{generation - 1}", "v", "exp", "delta")
+    value = cache_codec.decode(raw)
+    if value is None:
+        return
+
+    try:
+        new_value = update(value)
+    except ValueError:
+        # Entry written by an older payload format, let the next reader rebuild it
+        return
+    if new_value is None:
+        return
+
+    remaining = float(expiry) - time.time()
+    if remaining <= 0:
+        return
+
+    await redis.eval(
+        STORE_IF_ABSENT_SCRIPT, 1, f"{family}:{generation}",
+        cache_codec.encode(new_value), expiry, delta, int(remaining) + settings.CACHE_STALE_SECONDS,
+    )
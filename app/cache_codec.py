@@ -0,0 +1,64 @@
+import zlib
+from typing import Optional
+
+from .config import settings
+
+try:
+    import zstandard
+except ImportError:  # optional, zlib is always available
+    zstandard = None
+
+# Layout of a cached payload: [format version][flags][body]
+# The body is the response JSON, compressed when it's larger than CACHE_COMPRESS_MIN_BYTES.
+# Readers treat anything they can't decode (newer version, missing codec) as a cache miss,
+# so a new format can be rolled out one worker at a time.
+FORMAT_VERSION = 1
+
+FLAG_ZLIB = 0x01
+FLAG_ZSTD = 0x02
+
+_zstd_compressor = zstandard.ZstdCompressor(level=3) if zstandard else None
+_zstd_decompressor = zstandard.ZstdDecompressor() if zstandard else None
+_decode_errors = (zlib.error, ValueError) + ((zstandard.ZstdError,) if zstandard else ())
+
+
+def _compression() -> str:
+    if settings.CACHE_COMPRESSION == "auto":
+        return "zstd" if zstandard else "zlib"
+    return settings.CACHE_COMPRESSION
+
+
+def encode(body: bytes) -> bytes:
+    flags = 0
+    compression = _compression()
+
+    if len(body) >= settings.CACHE_COMPRESS_MIN_BYTES:
+        if compression == "zstd" and _zstd_compressor:
+            body = _zstd_compressor.compress(body)
+            flags = FLAG_ZSTD
+        elif compression == "zlib":
+            body = zlib.compress(body, 1)
+            flags = FLAG_ZLIB
+
+    return bytes((FORMAT_VERSION, flags)) + body
+
+
+def decode(data: Optional[bytes]) -> Optional[bytes]:
+    if not data or len(data) < 2 or data[0] != FORMAT_VERSION:
+        return None
+
+    flags = data[1]
+    body = memoryview(data)[2:]
+
+    try:
+        if flags == FLAG_ZSTD:
+            if not _zstd_decompressor:
+                return None
+            return _zstd_decompressor.decompress(body)
+        if flags == FLAG_ZLIB:
+            return zlib.decompress(body)
+        if flags == 0:
+            return bytes(body)
+    except _decode_errors:
+        return None
+    return None
@@ -1,3 +1,4 @@
+from typing import Dict, List, Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -5,6 +6,16 @@ class Settings(BaseSettings):
     POSTGRES_USER: str
     POSTGRES_PASSWORD: str
     POSTGRES_DB: str
+    POSTGRES_HOST: str = "db"
+    POSTGRES_PORT: int = 5432
+    DATABASE_REPLICA_URLS: str = ""  # comma-separated read replica URLs; empty = read from the primary
+    READ_YOUR_WRITES_SECONDS: int = 10  # how long a user's reads stay on the primary after they write
+    DB_ECHO: bool = False
+    
+    # SQL Logging
+    SLOW_QUERY_MS: int = 200
+    QUERY_LOG_SAMPLE_RATE: float = 0.0  # fraction of all statements to log regardless of duration
+    N_PLUS_ONE_THRESHOLD: int = 20  # flag requests that run more statements than this
     
     # Security
     SECRET_KEY: str
@@ -19,9 +30,79 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
     
+    # Rate Limiting (token buckets: sustained rate per minute, burst = bucket size)
+    RATE_LIMIT_ENABLED: bool = True
+    LOGIN_RATE_PER_MINUTE: int = 10  # per client IP and per account
+    LOGIN_BURST: int = 5
+    SEARCH_RATE_PER_MINUTE: int = 60  # per client IP and per user
+    SEARCH_BURST: int = 20
+    
+    # Admission Control (per worker)
+    SEARCH_MAX_CONCURRENCY: int = 8
+    SEARCH_QUEUE_DEADLINE_MS: int = 500
+    
+    # Refresh Token Maintenance
+    TOKEN_MAINTENANCE_INTERVAL_SECONDS: int = 3600
+    TOKEN_PURGE_BATCH_SIZE: int = 1000
+    TOKEN_PURGE_BATCH_PAUSE_MS: int = 100
+    TOKEN_PARTITION_WEEKS_AHEAD: int = 4
+    TOKEN_PARTITION_LOCK_TIMEOUT_MS: int = 200  # longest a partition drop may hold up logins waiting for its lock; retried next run
+    
+    # Password Hashing
+    HASH_POOL_WORKERS: Optional[int] = None  # None = one per CPU core, 0 = hash on the event loop
+    HASH_QUEUE_SIZE: int = 32
+    ARGON2_ROUNDS: int = 3
+    ARGON2_TARGET_MS: int = 0  # 0 disables startup calibration
+    ARGON2_MAX_ROUNDS: int = 10
+    
+    # Note Encryption
+    ENCRYPTION_KEY_ID: int = 1  # 0-255, written into every note ciphertext header
+    ENCRYPTION_KEYS: str = ""  # retired keys still accepted for reads, comma-separated "<key id>:<key>"
+    BLIND_INDEX_KEY: str = ""  # keys private-note search tokens, independent of key rotation; empty = derived from ENCRYPTION_KEY (deprecated). Changing it means running app.search_index
+    CRYPTO_POOL_WORKERS: int = 4
+    CRYPTO_INLINE_MAX_ITEMS: int = 32
+    CRYPTO_INLINE_MAX_BYTES: int = 64 * 1024
+    REENCRYPT_BATCH_SIZE: int = 500  # rows per transaction when moving notes to the primary key
+    REENCRYPT_ROWS_PER_SECOND: int = 1000  # 0 = unthrottled
+    REENCRYPT_MAX_ACTIVE_QUERIES: int = 20  # pause while more queries than this run on the primary
+    REENCRYPT_BACKOFF_SECONDS: float = 5.0
+    SEARCH_INDEX_BATCH_SIZE: int = 500  # notes per transaction when backfilling private-note search tokens
+    SEARCH_INDEX_ROWS_PER_SECOND: int = 1000  # 0 = unthrottled
+    
+    # Export
+    EXPORT_CHUNK_SIZE: int = 1000
+    
+    # Response Cache
+    CACHE_STALE_SECONDS: int = 30
+    CACHE_LOCK_TIMEOUT_MS: int = 5000
+    CACHE_EARLY_REFRESH_BETA: float = 1.0
+    CACHE_COMPRESSION: str = "auto"  # auto (zstd if the zstandard package is installed, else zlib), zstd, zlib, none
+    CACHE_COMPRESS_MIN_BYTES: int = 1024
+    CACHE_L1_TTL_SECONDS: float = 2.0
+    CACHE_L1_MAX_ENTRIES: int = 1000
+    SEARCH_CACHE_TTL_SECONDS: int = 300  # public writes invalidate search results, so this only bounds memory
+    
+    # Principal Cache
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 30
+    PRINCIPAL_CACHE_MAX_ENTRIES: int = 10000
+    
     @property
     def DATABASE_URL(self) -> str:
-        return f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@db:5432/{self.POSTGRES_DB}"
+        return f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
+
+    @property
+    def replica_urls(self) -> List[str]:
+        return [url.strip() for url in self.DATABASE_REPLICA_URLS.split(",") if url.strip()]
+
+    @property
+    def encryption_keys(self) -> Dict[int, str]:
+        keys = {}
+        for entry in self.ENCRYPTION_KEYS.split(","):
+            if entry.strip():
+                key_id, key = entry.strip().split(":", 1)
+                keys[int(key_id)] = key
+        keys[self.ENCRYPTION_KEY_ID] = self.ENCRYPTION_KEY
+        return keys
 
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
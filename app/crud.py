@@ -1,11 +1,15 @@
+import logging
 from datetime import datetime, timezone
-from typing import Optional, List
+from typing import AsyncIterator, Optional, List, Tuple
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
-from sqlalchemy import or_, func, text
-from .models import User, UserCreate, UserPublic, RefreshToken, Note, NoteCreate, NotePublicWithUsername
+from sqlalchemy import func, tuple_, literal, Float, insert, update
+from .models import utcnow, User, UserCreate, UserPublic, RefreshToken, Note, NoteCreate, NotePublic, NotePublicWithUsername, NoteSearchToken
 
-from .crypto import encrypt_text, decrypt_text
+from . import crypto
+from .crypto import encrypt_many, search_tokens_many, try_decrypt_many
+
+logger = logging.getLogger("uvicorn")
 
 async def get_user_by_email(session: AsyncSession, email: str) -> Optional[User]:
     statement = select(User).where(User.email == email)
@@ -16,7 +20,7 @@ async def get_user_by_email(session: AsyncSession, email: str) -> Optional[User]
 async def create_user(session: AsyncSession, user_data: UserCreate) -> UserPublic:
     from .auth import get_password_hash
     
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash(user_data.password)
     
     db_user = User(
         username=user_data.username,
@@ -33,85 +37,258 @@ async def create_user(session: AsyncSession, user_data: UserCreate) -> UserPubli
     return UserPublic.model_validate(db_user)
 
 
+async def update_user_password_hash(session: AsyncSession, user: User, hashed_password: str) -> User:
+    user.hashed_password = hashed_password
+    session.add(user)
+    await session.commit()
+    return user
+
+
 async def create_db_refresh_token(session: AsyncSession, user_id: int, jti: str, expires_at: datetime) -> RefreshToken:
+    # A login starts a new token family, named after its first token
     db_token = RefreshToken(
         user_id=user_id,
         jti=jti,
+        family_id=jti,
         expires_at=expires_at,
         is_used=False
     )
     
     session.add(db_token)
     await session.commit()
-    await session.refresh(db_token)
     
     return db_token
 
-async def get_valid_refresh_token(session: AsyncSession, jti: str) -> Optional[RefreshToken]:
-    statement = select(RefreshToken).where(
-        RefreshToken.jti == jti,
-        RefreshToken.is_used == False,
-        RefreshToken.expires_at > datetime.now(timezone.utc)
+async def rotate_refresh_token(session: AsyncSession, jti: str, new_jti: str, new_expires_at: datetime) -> Optional[Tuple[int, str]]:
+    """Consume `jti` and issue `new_jti` in the same family, in one statement.
+
+    Returns the owner's (id, email), or None when the token is unknown, expired or
+    already used. Concurrent calls with the same token serialize on the row lock
+    taken by the UPDATE, so exactly one of them gets a result.
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    used = (
+        update(RefreshToken)
+        .where(RefreshToken.jti == jti, RefreshToken.is_used == False, RefreshToken.expires_at > now)
+        .values(is_used=True)
+        .returning(RefreshToken.user_id, RefreshToken.family_id)
+        .cte("used")
     )
-    result = await session.exec(statement)
-    return result.first()
+    issued = (
+        insert(RefreshToken)
+        .from_select(
+            ["user_id", "family_id", "jti", "expires_at", "is_used"],
+            select(used.c.user_id, used.c.family_id, literal(new_jti), literal(new_expires_at), literal(False)),
+        )
+        .returning(RefreshToken.user_id)
+        .cte("issued")
+    )
+    statement = select(User.id, User.email).join(issued, issued.c.user_id == User.id)
 
+    result = await session.exec(statement)
+    owner = result.first()
+    await session.commit()
+    return tuple(owner) if owner else None
 
-async def mark_refresh_token_as_used(session: AsyncSession, token_id: int):
-    token = await session.get(RefreshToken, token_id)
-    if token:
-        token.is_used = True
-        session.add(token)
-        await session.commit()
+async def revoke_refresh_token_family(session: AsyncSession, jti: str) -> int:
+    # Only a token that was already rotated counts as reuse; unknown or expired ones are just rejected
+    family_id = select(RefreshToken.family_id).where(RefreshToken.jti == jti, RefreshToken.is_used == True).scalar_subquery()
+    statement = (
+        update(RefreshToken)
+        .where(RefreshToken.family_id == family_id, RefreshToken.is_used == False)
+        .values(is_used=True)
+    )
+    result = await session.exec(statement)
+    await session.commit()
+    return result.rowcount
         
 
-async def create_note(session: AsyncSession, note_in: NoteCreate, owner_id: int) -> Note:
-    title_to_save = note_in.title
-    content_to_save = note_in.content
-    
-    if not note_in.is_public:
-        title_to_save = encrypt_text(note_in.title)
-        content_to_save = encrypt_text(note_in.content)
+def _sealed_fields(note) -> Tuple:
+    # Private notes not yet converted by app.reencrypt still carry Fernet text
+    if note.title_enc is not None:
+        return note.title_enc, note.content_enc
+    return note.title, note.content
+
+
+async def _seal(notes_in: List[NoteCreate]) -> dict:
+    """Encrypt the private notes of `notes_in` in one batch, as column values keyed by id(note_in)."""
+    private_notes = [note_in for note_in in notes_in if not note_in.is_public]
+    ciphertexts = await encrypt_many([value for note_in in private_notes for value in (note_in.title, note_in.content)])
+    return {
+        id(note_in): {"title": "", "content": "", "title_enc": ciphertexts[2 * i], "content_enc": ciphertexts[2 * i + 1]}
+        for i, note_in in enumerate(private_notes)
+    }
+
+
+async def _index(notes_in: List[NoteCreate], owner_id: int) -> dict:
+    """Blind-index tokens of the private notes of `notes_in`, keyed by id(note_in)."""
+    private_notes = [note_in for note_in in notes_in if not note_in.is_public]
+    tokens = await search_tokens_many(owner_id, [f"{note_in.title} {note_in.content}" for note_in in private_notes])
+    return {id(note_in): note_tokens for note_in, note_tokens in zip(private_notes, tokens)}
+
+
+async def create_note(session: AsyncSession, note_in: NoteCreate, owner_id: int) -> NotePublic:
+    sealed = await _seal([note_in])
+    tokens = await _index([note_in], owner_id)
+    columns = sealed.get(id(note_in), {"title": note_in.title, "content": note_in.content})
 
     db_note = Note(
-        title=title_to_save,
-        content=content_to_save,
+        **columns,
         is_public=note_in.is_public,
         owner_id=owner_id
     )
     session.add(db_note)
+    if not note_in.is_public:
+        await session.flush()
+        session.add(NoteSearchToken(
+            note_id=db_note.id, owner_id=owner_id, key_id=crypto.search_index_key_id, tokens=tokens[id(note_in)],
+        ))
     await session.commit()
     await session.refresh(db_note)
-    
-    db_note.title = note_in.title
-    db_note.content = note_in.content 
-    return db_note
 
+    # The caller gets the plaintext on a detached model, never on the session's entity
+    return NotePublic(
+        id=db_note.id, title=note_in.title, content=note_in.content, is_public=db_note.is_public,
+        owner_id=owner_id, created_at=db_note.created_at, updated_at=db_note.updated_at,
+    )
+
+
+async def create_notes_bulk(session: AsyncSession, notes_in: List[NoteCreate], owner_id: int) -> List[Note]:
+    sealed = await _seal(notes_in)
+    tokens = await _index(notes_in, owner_id)
+
+    now = utcnow()
+    rows = []
+    for note_in in notes_in:
+        columns = sealed.get(id(note_in)) or {
+            "title": note_in.title, "content": note_in.content, "title_enc": None, "content_enc": None,
+        }
+        rows.append({
+            **columns, "is_public": note_in.is_public, "owner_id": owner_id,
+            "created_at": now, "updated_at": now,
+        })
+
+    # One multi-row INSERT ... RETURNING (batched by SQLAlchemy's insertmanyvalues) and one commit
+    statement = insert(Note).returning(Note.id, sort_by_parameter_order=True)
+    result = await session.exec(statement, params=rows)
+    ids = result.scalars().all()
 
-async def get_notes_by_owner(session: AsyncSession, owner_id: int) -> list[Note]:
-    statement = select(Note).where(Note.owner_id == owner_id)
+    token_rows = [
+        {"note_id": note_id, "owner_id": owner_id, "key_id": crypto.search_index_key_id, "tokens": tokens[id(note_in)]}
+        for note_id, note_in in zip(ids, notes_in) if not note_in.is_public
+    ]
+    if token_rows:
+        await session.exec(insert(NoteSearchToken), params=token_rows)
+    await session.commit()
+
+    return [
+        Note(
+            id=note_id, title=note_in.title, content=note_in.content, is_public=note_in.is_public,
+            owner_id=owner_id, created_at=now, updated_at=now,
+        )
+        for note_id, note_in in zip(ids, notes_in)
+    ]
+
+
+# Plain columns instead of Note entities: nothing lands in the identity map, and the
+# decrypted text never sits on an entity a later flush could write back
+NOTE_COLUMNS = (
+    Note.id, Note.title, Note.content, Note.title_enc, Note.content_enc,
+    Note.is_public, Note.owner_id, Note.created_at, Note.updated_at,
+)
+
+async def _decrypt_rows(rows) -> List[NotePublic]:
+    ciphertexts = [value for row in rows if not row.is_public for value in _sealed_fields(row)]
+    plaintexts = iter(await try_decrypt_many(ciphertexts))
+
+    notes = []
+    for row in rows:
+        title, content = (row.title, row.content) if row.is_public else (next(plaintexts), next(plaintexts))
+        if title is None or content is None:
+            # Sealed with a key that's no longer loaded (or corrupt): leave it out rather than fail the page
+            logger.warning(f"Note {row.id} can't be decrypted with any loaded key, omitting it")
+            continue
+        notes.append(NotePublic(
+            id=row.id, title=title, content=content, is_public=row.is_public,
+            owner_id=row.owner_id, created_at=row.created_at, updated_at=row.updated_at,
+        ))
+    return notes
+
+async def get_notes_by_owner(session: AsyncSession, owner_id: int, limit: int, after_id: Optional[int] = None) -> Tuple[List[NotePublic], Optional[tuple]]:
+    statement = select(*NOTE_COLUMNS).where(Note.owner_id == owner_id)
+    if after_id is not None:
+        statement = statement.where(Note.id > after_id)
+
+    statement = statement.order_by(Note.id).limit(limit + 1)
     result = await session.exec(statement)
-    notes = result.all()
-    
-    decrypted_notes = []
-    for note in notes:
-        if not note.is_public:
-            note.title = decrypt_text(note.title)
-            note.content = decrypt_text(note.content)
-        decrypted_notes.append(note)
-        
-    return decrypted_notes
+    rows = result.all()
+
+    next_key = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_key = (rows[-1].id,)
+
+    return await _decrypt_rows(rows), next_key
+
+async def search_private_notes(session: AsyncSession, query: str, owner_id: int, limit: int, before_id: Optional[int] = None) -> Tuple[List[NotePublic], Optional[tuple]]:
+    # Every query word has to match; newest first
+    (tokens,) = await search_tokens_many(owner_id, [query])
+    if not tokens:
+        return [], None
+
+    statement = (
+        select(*NOTE_COLUMNS)
+        .join(NoteSearchToken, NoteSearchToken.note_id == Note.id)
+        .where(NoteSearchToken.tokens.contains(tokens), NoteSearchToken.owner_id == owner_id)
+    )
+    if before_id is not None:
+        statement = statement.where(Note.id < before_id)
+
+    statement = statement.order_by(Note.id.desc()).limit(limit + 1)
+    result = await session.exec(statement)
+    rows = result.all()
+
+    next_key = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_key = (rows[-1].id,)
 
-async def get_public_notes(session: AsyncSession, limit: int = 100) -> List[NotePublicWithUsername]:
+    return await _decrypt_rows(rows), next_key
+
+async def stream_notes_by_owner(session: AsyncSession, owner_id: int, chunk_size: int) -> AsyncIterator[List[NotePublic]]:
+    # Memory stays at one chunk no matter how many notes the user has
+    statement = (
+        select(*NOTE_COLUMNS)
+        .where(Note.owner_id == owner_id)
+        .order_by(Note.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    result = await session.stream(statement)
+
+    async for rows in result.partitions():
+        yield await _decrypt_rows(rows)
+
+async def get_public_notes(session: AsyncSession, limit: int, before: Optional[Tuple[datetime, int]] = None) -> Tuple[List[NotePublicWithUsername], Optional[tuple]]:
+    # Newest first; served straight off ix_note_public_feed (created_at DESC, id DESC) WHERE is_public
     statement = (
         select(Note, User.username)
         .join(User)
         .where(Note.is_public == True)
-        .limit(limit)
     )
+    if before is not None:
+        statement = statement.where(tuple_(Note.created_at, Note.id) < tuple_(*before))
+
+    statement = statement.order_by(Note.created_at.desc(), Note.id.desc()).limit(limit + 1)
     
     result = await session.exec(statement)
     results = result.all()
+
+    next_key = None
+    if len(results) > limit:
+        results = results[:limit]
+        last_note = results[-1][0]
+        next_key = (last_note.created_at, last_note.id)
     
     output_list = []
     for note, username in results:
@@ -119,29 +296,38 @@ async def get_public_notes(session: AsyncSession, limit: int = 100) -> List[Note
         note_data["owner_username"] = username
         output_list.append(NotePublicWithUsername(**note_data))
         
-    return output_list
+    return output_list, next_key
 
-async def search_notes(session: AsyncSession, query: str, owner_id: int, offset: int, limit: int) -> list[NotePublicWithUsername]:
-    search_vector = func.to_tsvector('english', func.coalesce(Note.title, '') + ' ' + func.coalesce(Note.content, ''))
+async def search_notes(session: AsyncSession, query: str, owner_id: int, limit: int, after: Optional[tuple] = None) -> Tuple[list[NotePublicWithUsername], Optional[tuple]]:
+    search_vector = Note.__table__.c.search_vector
     search_query = func.websearch_to_tsquery('english', query)
+    rank = func.ts_rank(search_vector, search_query)
     
     statement = (
-        select(Note, User.username)
+        select(Note, User.username, rank)
         .join(User)
         .where(Note.is_public == True)
         .where(search_vector.op("@@")(search_query))
-        .order_by(func.ts_rank(search_vector, search_query).desc())
-        .offset(offset)
-        .limit(limit)
     )
+    if after is not None:
+        after_rank, after_id = after
+        statement = statement.where(tuple_(rank, Note.id) < tuple_(literal(after_rank, Float), literal(after_id)))
+
+    statement = statement.order_by(rank.desc(), Note.id.desc()).limit(limit + 1)
     
     result = await session.exec(statement)
     results = result.all()
+
+    next_key = None
+    if len(results) > limit:
+        results = results[:limit]
+        last_note, _, last_rank = results[-1]
+        next_key = (last_rank, last_note.id)
     
     output_list = []
-    for note, username in results:
+    for note, username, _ in results:
         note_data = note.model_dump()
         note_data["owner_username"] = username
         output_list.append(NotePublicWithUsername(**note_data))
         
-    return output_list
\ No newline at end of file
+    return output_list, next_key
@@ -1,26 +1,212 @@
-from cryptography.fernet import Fernet, InvalidToken
-from .config import settings
+import asyncio
+import base64
+import hashlib
+import hmac
 import logging
+import os
+import re
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, List, Optional, Sequence, Set, Union
+
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from .config import settings
+from .metrics import CRYPTO_BATCH_DURATION
 
 logger = logging.getLogger("uvicorn")
 
+# Private note fields are stored as bytea:
+#   version (1 byte) | key id (1 byte) | nonce (12 bytes) | AES-256-GCM ciphertext + 16-byte tag
+# The header is authenticated as associated data. Rows written before this format
+# hold base64 Fernet tokens in the text columns and are still readable.
+#
+# New values are always written with the primary key (ENCRYPTION_KEY / ENCRYPTION_KEY_ID);
+# reads pick the key named in the header, so retired keys (ENCRYPTION_KEYS) keep old
+# rows readable until app.reencrypt has moved them to the primary key.
+FORMAT_VERSION = 1
+HEADER_SIZE = 2
+NONCE_SIZE = 12
+TAG_SIZE = 16
+
+# What decrypting a value sealed with a key that isn't loaded, or a corrupt one, raises
+DECRYPT_ERRORS = (InvalidToken, InvalidTag, ValueError)
+
+cipher: MultiFernet
+aead_keys: Dict[int, AESGCM] = {}
+header: bytes = b""
+
+
+def _hkdf(secret: bytes, info: bytes) -> bytes:
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=info).derive(secret)
+
+def _derive_aead_key(key: str) -> AESGCM:
+    # Separate AES key derived from the same secret, so one key covers both formats
+    return AESGCM(_hkdf(base64.urlsafe_b64decode(key), b"securenote note fields v1"))
+
+
+def load_keys(primary_id: int, keys: Dict[int, str]):
+    global cipher, aead_keys, header
+    # Fernet tokens carry no key id, so legacy rows are tried against every key, primary first
+    cipher = MultiFernet([Fernet(keys[primary_id])] + [Fernet(key) for key_id, key in keys.items() if key_id != primary_id])
+    aead_keys = {key_id: _derive_aead_key(key) for key_id, key in keys.items()}
+    header = bytes([FORMAT_VERSION, primary_id])
+
+
 try:
-    cipher = Fernet(settings.ENCRYPTION_KEY)
+    load_keys(settings.ENCRYPTION_KEY_ID, settings.encryption_keys)
 except Exception as e:
     logger.error(f"CRITICAL: Encryption Key is invalid! {e}")
     raise e
 
+# Blind index for searching private notes: truncated HMACs of the normalized words,
+# keyed per owner so the same word in two users' notes gives unrelated tokens. The
+# database only learns which of a user's notes share a word, never the word itself.
+WORD_PATTERN = re.compile(r"\w{2,64}")
+SEARCH_TOKEN_BYTES = 12
+
+search_index_key: bytes = b""
+search_index_key_id: int = 0
+
+
+def load_search_key(secret: bytes):
+    global search_index_key, search_index_key_id
+    search_index_key = _hkdf(secret, b"securenote blind index v1")
+    # Stored with every token row (a fingerprint, so changing the key can't forget to
+    # change it): rows carrying another id were made with an earlier key, can't match
+    # any query and are rebuilt by app.search_index
+    fingerprint = hmac.new(search_index_key, b"key id", hashlib.sha256).digest()
+    search_index_key_id = int.from_bytes(fingerprint[:4], "big", signed=True)
+
+
+if not settings.BLIND_INDEX_KEY:
+    logger.warning(
+        "BLIND_INDEX_KEY is not set: private search tokens follow ENCRYPTION_KEY and "
+        "have to be rebuilt with `python -m app.search_index` after every key rotation"
+    )
+load_search_key(
+    settings.BLIND_INDEX_KEY.encode() if settings.BLIND_INDEX_KEY else base64.urlsafe_b64decode(settings.ENCRYPTION_KEY)
+)
+
+crypto_pool = None
+
 def encrypt_text(plain_text: str) -> str:
     if not plain_text:
         return ""
     return cipher.encrypt(plain_text.encode()).decode()
 
-def decrypt_text(encrypted_text: str) -> str:
+def decrypt_text(encrypted_text: str, strict: bool = False) -> str:
     if not encrypted_text:
         return ""
     
     try:
         return cipher.decrypt(encrypted_text.encode()).decode()
     except InvalidToken:
+        # strict: anything that must not mistake a token it can't read for plaintext
+        if strict:
+            raise
         return encrypted_text
-        
\ No newline at end of file
+
+
+def encrypt_bytes(plain_text: str) -> bytes:
+    nonce = os.urandom(NONCE_SIZE)
+    return header + nonce + aead_keys[header[1]].encrypt(nonce, plain_text.encode(), header)
+
+def decrypt_bytes(data: bytes) -> str:
+    if len(data) < HEADER_SIZE + NONCE_SIZE + TAG_SIZE:
+        raise ValueError(f"Ciphertext too short ({len(data)} bytes)")
+    data_header = data[:HEADER_SIZE]
+    key = aead_keys.get(data_header[1]) if data_header[0] == FORMAT_VERSION else None
+    if key is None:
+        raise ValueError(f"No key for ciphertext header {data_header.hex()}")
+    nonce = data[HEADER_SIZE:HEADER_SIZE + NONCE_SIZE]
+    return key.decrypt(nonce, data[HEADER_SIZE + NONCE_SIZE:], data_header).decode()
+
+def decrypt_any(data: Union[bytes, str], strict: bool = False) -> str:
+    # bytes from the bytea columns, str from rows still holding Fernet tokens
+    if isinstance(data, str):
+        return decrypt_text(data, strict)
+    return decrypt_bytes(data)
+
+
+def normalize_words(text: str) -> Set[str]:
+    return set(WORD_PATTERN.findall(unicodedata.normalize("NFKC", text).casefold()))
+
+def search_tokens(owner_id: int, text: str) -> List[str]:
+    owner_mac = hmac.new(search_index_key, f"{owner_id}:".encode(), hashlib.sha256)
+    tokens = []
+    for word in sorted(normalize_words(text)):
+        mac = owner_mac.copy()
+        mac.update(word.encode())
+        tokens.append(base64.urlsafe_b64encode(mac.digest()[:SEARCH_TOKEN_BYTES]).decode())
+    return tokens
+
+
+def _encrypt_batch(texts: Sequence[str]) -> List[bytes]:
+    return [encrypt_bytes(text) for text in texts]
+
+def _decrypt_batch(texts: Sequence[Union[bytes, str]], strict: bool = False) -> List[str]:
+    return [decrypt_any(text, strict) for text in texts]
+
+def _try_decrypt_batch(texts: Sequence[Union[bytes, str]], strict: bool = False) -> List[Optional[str]]:
+    plaintexts = []
+    for text in texts:
+        try:
+            plaintexts.append(decrypt_any(text, strict))
+        except DECRYPT_ERRORS:
+            plaintexts.append(None)
+    return plaintexts
+
+def _search_tokens_batch(owner_id: int, texts: Sequence[str]) -> List[List[str]]:
+    return [search_tokens(owner_id, text) for text in texts]
+
+
+def get_crypto_pool():
+    global crypto_pool
+    if crypto_pool is None:
+        crypto_pool = ThreadPoolExecutor(
+            max_workers=settings.CRYPTO_POOL_WORKERS,
+            thread_name_prefix="crypto",
+        )
+    return crypto_pool
+
+def close_crypto_pool():
+    global crypto_pool
+    if crypto_pool:
+        crypto_pool.shutdown(wait=False, cancel_futures=True)
+        crypto_pool = None
+
+
+async def _run_batch(func: Callable[[Sequence], List], texts: Sequence) -> List:
+    # Small batches are cheaper to run inline than to hand off to a thread
+    if len(texts) <= settings.CRYPTO_INLINE_MAX_ITEMS and sum(len(t) for t in texts) <= settings.CRYPTO_INLINE_MAX_BYTES:
+        return func(texts)
+
+    loop = asyncio.get_running_loop()
+    pool = get_crypto_pool()
+    chunk_size = -(-len(texts) // settings.CRYPTO_POOL_WORKERS)
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+
+    results = await asyncio.gather(*(loop.run_in_executor(pool, func, chunk) for chunk in chunks))
+    return [text for chunk in results for text in chunk]
+
+async def encrypt_many(texts: Sequence[str]) -> List[bytes]:
+    with CRYPTO_BATCH_DURATION.labels("encrypt").time():
+        return await _run_batch(_encrypt_batch, texts)
+
+async def decrypt_many(texts: Sequence[Union[bytes, str]], strict: bool = False) -> List[str]:
+    with CRYPTO_BATCH_DURATION.labels("decrypt").time():
+        return await _run_batch(partial(_decrypt_batch, strict=strict), texts)
+
+async def try_decrypt_many(texts: Sequence[Union[bytes, str]], strict: bool = False) -> List[Optional[str]]:
+    """decrypt_many, with None in place of each value no loaded key can decrypt instead of raising."""
+    with CRYPTO_BATCH_DURATION.labels("decrypt").time():
+        return await _run_batch(partial(_try_decrypt_batch, strict=strict), texts)
+
+async def search_tokens_many(owner_id: int, texts: Sequence[str]) -> List[List[str]]:
+    with CRYPTO_BATCH_DURATION.labels("search_tokens").time():
+        return await _run_batch(partial(_search_tokens_batch, owner_id), texts)
@@ -1,22 +1,52 @@
-from typing import AsyncGenerator 
-from sqlalchemy.ext.asyncio import create_async_engine
+import random
+from typing import AsyncGenerator, Optional
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.orm import sessionmaker
 from sqlmodel import SQLModel
 from .config import settings
+from .metrics import InstrumentedPool, instrument_engine
 
 engine = create_async_engine(
     settings.DATABASE_URL,
-    echo=True,
+    echo=settings.DB_ECHO,
     future=True,
+    poolclass=InstrumentedPool,
     pool_size=20,
     max_overflow=10,
     pool_pre_ping=True,
 )
 
+# Read-only connections: a write routed here by mistake fails instead of diverging
+replica_engines = [
+    create_async_engine(
+        url,
+        echo=settings.DB_ECHO,
+        future=True,
+        poolclass=InstrumentedPool,
+        pool_size=20,
+        max_overflow=10,
+        pool_pre_ping=True,
+        connect_args={"server_settings": {"default_transaction_read_only": "on"}},
+    )
+    for url in settings.replica_urls
+]
+
+instrument_engine(engine, "primary")
+for index, replica_engine in enumerate(replica_engines):
+    instrument_engine(replica_engine, f"replica{index}")
+
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
     async_session = sessionmaker(
         bind=engine, class_=AsyncSession, expire_on_commit=False
     )
     async with async_session() as session:
         yield session
+
+def get_read_engine() -> Optional[AsyncEngine]:
+    return random.choice(replica_engines) if replica_engines else None
+
+async def dispose_engines():
+    await engine.dispose()
+    for replica_engine in replica_engines:
+        await replica_engine.dispose()
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from .config import settings
+from .metrics import PASSWORD_HASH_DURATION
+
+logger = logging.getLogger("uvicorn")
+
+# min_rounds makes needs_update() flag weaker hashes only, so workers calibrated
+# to slightly different costs never downgrade each other's hashes
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__default_rounds=settings.ARGON2_ROUNDS,
+    argon2__min_rounds=settings.ARGON2_ROUNDS,
+)
+
+hash_pool = None
+in_flight = 0
+
+# Each worker process rebuilds the context from the parent's (possibly calibrated) config
+_worker_context: Optional[CryptContext] = None
+
+
+def _init_worker(config: dict):
+    global _worker_context
+    _worker_context = CryptContext(**config)
+
+def _hash(password: str) -> str:
+    return (_worker_context or pwd_context).hash(password)
+
+def _verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return (_worker_context or pwd_context).verify_and_update(password, hashed_password)
+
+
+def calibrate_argon2(target_ms: int) -> int:
+    # Never go below the configured cost, only raise it until one hash takes ~target_ms
+    rounds = settings.ARGON2_ROUNDS
+    while rounds < settings.ARGON2_MAX_ROUNDS:
+        context = CryptContext(schemes=["argon2"], argon2__rounds=rounds)
+        start = time.perf_counter()
+        context.hash("calibration-password")
+        if (time.perf_counter() - start) * 1000 >= target_ms:
+            break
+        rounds += 1
+
+    pwd_context.update(argon2__default_rounds=rounds, argon2__min_rounds=rounds)
+    logger.info(f"Argon2 calibrated to rounds={rounds} for a {target_ms} ms target")
+    return rounds
+
+
+def _pool_size() -> int:
+    return settings.HASH_POOL_WORKERS or os.cpu_count() or 1
+
+def get_hash_pool():
+    global hash_pool
+    if hash_pool is None and settings.HASH_POOL_WORKERS != 0:
+        hash_pool = ProcessPoolExecutor(
+            max_workers=_pool_size(),
+            initializer=_init_worker,
+            initargs=(pwd_context.to_dict(),),
+        )
+    return hash_pool
+
+def start_hash_pool():
+    if settings.ARGON2_TARGET_MS:
+        calibrate_argon2(settings.ARGON2_TARGET_MS)
+    return get_hash_pool()
+
+def close_hash_pool():
+    global hash_pool
+    if hash_pool:
+        hash_pool.shutdown(cancel_futures=True)
+        hash_pool = None
+
+
+async def _run(operation: str, func, *args):
+    global in_flight
+    pool = get_hash_pool()
+
+    if pool is None:
+        # HASH_POOL_WORKERS=0: hash on the event loop thread (debugging / benchmarks only)
+        with PASSWORD_HASH_DURATION.labels(operation).time():
+            return func(*args)
+
+    if in_flight >= _pool_size() + settings.HASH_QUEUE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please retry shortly.",
+            headers={"Retry-After": "1"},
+        )
+
+    in_flight += 1
+    try:
+        with PASSWORD_HASH_DURATION.labels(operation).time():
+            return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+    finally:
+        in_flight -= 1
+
+
+async def hash_password(password: str) -> str:
+    return await _run("hash", _hash, password)
+
+async def verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return await _run("verify", _verify_and_update, password, hashed_password)
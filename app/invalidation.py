@@ -0,0 +1,46 @@
+import asyncio
+import logging
+from typing import Callable, Dict, Tuple
+
+from . import redis_client
+
+logger = logging.getLogger("uvicorn")
+
+# channel -> (on_message(data), on_reset()); on_reset runs whenever messages may have been missed
+_subscriptions: Dict[str, Tuple[Callable[[str], None], Callable[[], None]]] = {}
+
+
+def subscribe(channel: str, on_message: Callable[[str], None], on_reset: Callable[[], None]):
+    _subscriptions[channel] = (on_message, on_reset)
+
+
+async def publish(channel: str, data: str):
+    redis = redis_client.get_redis_pool()
+    await redis.publish(channel, data)
+
+
+def _reset_all():
+    for _, on_reset in _subscriptions.values():
+        on_reset()
+
+
+async def listen():
+    while True:
+        redis = redis_client.get_redis_pool()
+        pubsub = redis.pubsub()
+        try:
+            await pubsub.subscribe(*_subscriptions)
+            # Anything published while we were not subscribed is lost, start from a clean slate
+            _reset_all()
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    on_message, _ = _subscriptions[message["channel"].decode()]
+                    on_message(message["data"].decode())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Invalidation listener lost Redis connection: {e}")
+            _reset_all()
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
@@ -1,19 +1,34 @@
+import asyncio
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 
 from .routers import auth, notes 
 from . import database
 from . import redis_client
+from . import hashing
+from . import crypto
+from . import invalidation
+from . import token_maintenance
+from . import cache
+from . import metrics
+from .principal_cache import principal_cache
 
 from fastapi.middleware.cors import CORSMiddleware
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     redis_client.get_redis_pool()
+    hashing.start_hash_pool()
+    invalidation_listener = asyncio.create_task(invalidation.listen())
+    token_maintenance_task = asyncio.create_task(token_maintenance.run())
     yield
     print("Application is shutting down...")
+    invalidation_listener.cancel()
+    token_maintenance_task.cancel()
     await redis_client.close_redis_pool()
-    await database.engine.dispose()
+    hashing.close_hash_pool()
+    crypto.close_crypto_pool()
+    await database.dispose_engines()
 
 app = FastAPI(
     title="SecureNote API",
@@ -31,9 +46,17 @@ app.add_middleware( # to be changed in production level
     allow_headers=["*"],
 )
 
+app.add_middleware(metrics.MetricsMiddleware)
+
+metrics.register_local_caches({"principal": principal_cache, "public_feed_l1": cache.l1})
+
 app.include_router(auth.router)
 app.include_router(notes.router)
 
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    return metrics.metrics_response()
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to SecureNote API! Visit /docs for documentation."}
\ No newline at end of file
@@ -0,0 +1,181 @@
+import time
+from collections import Counter as StatementCounter
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from fastapi import Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from . import query_log
+from .local_cache import LocalCache
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route", "status"],
+)
+REQUESTS_RATE_LIMITED = Counter(
+    "http_requests_rate_limited_total", "Requests rejected with 429 by a rate limit", ["limit"],
+)
+REQUESTS_SHED = Counter(
+    "http_requests_shed_total", "Requests rejected with 503 by a concurrency limiter", ["route"],
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "Response cache lookups by outcome", ["family", "result"],
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Duration of a single SQL statement", ["route"],
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request", "SQL statements executed per request", ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "db_time_per_request_seconds", "Time spent in SQL per request", ["route"],
+)
+POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection", ["engine"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+POOL_IN_USE = Gauge("db_pool_connections_in_use", "Connections checked out of the pool", ["engine"])
+PASSWORD_HASH_DURATION = Histogram(
+    "password_hash_duration_seconds", "Argon2 hash/verify time, including pool queueing", ["operation"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.35, 0.5, 0.75, 1, 2.5, 5),
+)
+CRYPTO_BATCH_DURATION = Histogram(
+    "note_crypto_batch_duration_seconds", "Note encryption/decryption time per batch", ["operation"],
+)
+
+class RequestStats:
+    """Per-request SQL counters. Holds the ASGI scope, which the router fills in
+    with the matched route before any endpoint code runs."""
+
+    __slots__ = ("scope", "count", "seconds", "statements")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = StatementCounter()
+
+    @property
+    def route(self) -> str:
+        route = self.scope.get("route")
+        return route.path if route is not None else "unmatched"
+
+request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def cache_family(family: str) -> str:
+    # "user_notes:42" -> "user_notes", keeps label cardinality bounded
+    return family.split(":", 1)[0]
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware: records latency per route template and status, and the
+    number/duration of SQL statements the request ran."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        stats = RequestStats(scope)
+        stats_token = request_stats.set(stats)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            request_stats.reset(stats_token)
+            route = stats.route
+            REQUEST_LATENCY.labels(scope["method"], route, status_code).observe(time.perf_counter() - start)
+            DB_QUERIES_PER_REQUEST.labels(route).observe(stats.count)
+            DB_TIME_PER_REQUEST.labels(route).observe(stats.seconds)
+            query_log.check_request(route, stats.count, stats.statements)
+
+
+def instrument_engine(engine: AsyncEngine, name: str):
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _start_timer(conn, cursor, statement, parameters, context, executemany):
+        context._query_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_start
+        stats = request_stats.get()
+        if stats is None:
+            # Background work (token maintenance, invalidation listener, ...)
+            DB_QUERY_DURATION.labels("background").observe(elapsed)
+            query_log.record_query("background", statement, elapsed)
+            return
+
+        route = stats.route
+        DB_QUERY_DURATION.labels(route).observe(elapsed)
+        stats.count += 1
+        stats.seconds += elapsed
+        query_log.record_query(route, statement, elapsed, stats.statements)
+
+    if isinstance(sync_engine.pool, InstrumentedPool):
+        sync_engine.pool.metrics_name = name
+        # The engine swaps its pool on dispose(), so look it up at scrape time
+        POOL_IN_USE.labels(name).set_function(lambda: sync_engine.pool.checkedout())
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long checkouts wait for a free connection."""
+
+    metrics_name = "primary"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_WAIT.labels(self.metrics_name).observe(time.perf_counter() - start)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics_name = self.metrics_name
+        return pool
+
+
+class LocalCacheCollector:
+    """Exposes LocalCache counters (kept as plain ints on the hot path) at scrape time."""
+
+    def __init__(self, caches: Dict[str, LocalCache]):
+        self.caches = caches
+
+    def collect(self):
+        hits = CounterMetricFamily("local_cache_hits", "In-process cache hits", labels=["cache"])
+        misses = CounterMetricFamily("local_cache_misses", "In-process cache misses", labels=["cache"])
+        entries = GaugeMetricFamily("local_cache_entries", "In-process cache size", labels=["cache"])
+        for name, cache in self.caches.items():
+            stats = cache.stats()
+            hits.add_metric([name], stats["hits"])
+            misses.add_metric([name], stats["misses"])
+            entries.add_metric([name], stats["entries"])
+        yield hits
+        yield misses
+        yield entries
+
+
+def register_local_caches(caches: Dict[str, LocalCache]):
+    REGISTRY.register(LocalCacheCollector(caches))
+
+
+def metrics_response() -> Response:
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -1,7 +1,13 @@
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Optional, List
 from sqlmodel import Field, SQLModel, Relationship
 from pydantic import EmailStr
+from sqlalchemy import Column, Index, LargeBinary, Text, UniqueConstraint, text
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
 
 
 # ----------------------
@@ -37,10 +43,18 @@ class TokenRefreshRequest(SQLModel):
     refresh_token: str
 
 class RefreshToken(SQLModel, table=True):
-    id: Optional[int] = Field(default=None, primary_key=True)
+    # Range-partitioned by week of expires_at (see token_maintenance), so the
+    # partition key has to be part of every unique constraint
+    __table_args__ = (
+        UniqueConstraint("jti", "expires_at"),
+        {"postgresql_partition_by": "RANGE (expires_at)"},
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True, sa_column_kwargs={"autoincrement": True})
     user_id: int = Field(index=True)
-    jti: str = Field(unique=True) # JWT ID
-    expires_at: datetime
+    jti: str # JWT ID
+    family_id: str = Field(index=True) # jti of the login that started the rotation chain
+    expires_at: datetime = Field(primary_key=True)
     is_used: bool = Field(default=False)
 
 
@@ -53,18 +67,76 @@ class NoteBase(SQLModel):
     is_public: bool = Field(default=False)
 
 class Note(NoteBase, table=True):
+    __table_args__ = (
+        # Backs keyset pagination of a user's notes (WHERE owner_id = ? AND id > ? ORDER BY id)
+        Index("ix_note_owner_id_id", "owner_id", "id"),
+        # Maintained by the note_search_vector_trigger; left unmapped so feeds never load it
+        Column("search_vector", TSVECTOR, nullable=True),
+        Index("ix_note_search_vector", "search_vector", postgresql_using="gin"),
+        # Backs the newest-first public feed as a pure index range scan
+        Index(
+            "ix_note_public_feed",
+            text("created_at DESC"),
+            text("id DESC"),
+            postgresql_where=text("is_public"),
+        ),
+    )
+    __mapper_args__ = {"exclude_properties": ["search_vector"]}
+
     id: Optional[int] = Field(default=None, primary_key=True)
     owner_id: int = Field(index=True, foreign_key="user.id")
+    # Private notes keep title/content empty and store crypto.encrypt_bytes output here;
+    # NULL on public notes and on private notes still holding Fernet text (see app.reencrypt)
+    title_enc: Optional[bytes] = Field(default=None, sa_type=LargeBinary)
+    content_enc: Optional[bytes] = Field(default=None, sa_type=LargeBinary)
+    created_at: datetime = Field(default_factory=utcnow, sa_column_kwargs={"server_default": text("timezone('utc', now())")})
+    updated_at: datetime = Field(
+        default_factory=utcnow,
+        sa_column_kwargs={"server_default": text("timezone('utc', now())"), "onupdate": utcnow},
+    )
     owner: Optional[User] = Relationship(back_populates="notes")
 
+class NoteSearchToken(SQLModel, table=True):
+    # Blind index of a private note's words (crypto.search_tokens); tokens are per owner,
+    # so a GIN containment lookup only ever matches the searching user's notes
+    __table_args__ = (Index("ix_notesearchtoken_tokens", "tokens", postgresql_using="gin"),)
+
+    note_id: int = Field(primary_key=True, foreign_key="note.id", ondelete="CASCADE")
+    owner_id: int
+    key_id: int  # crypto.search_index_key_id of the key the tokens were made with
+    tokens: List[str] = Field(sa_column=Column(ARRAY(Text), nullable=False))
+
 class NoteCreate(NoteBase):
     pass
 
 class NotePublic(NoteBase):
     id: int
     owner_id: int
+    created_at: datetime
+    updated_at: datetime
 
 class NotePublicWithUsername(NoteBase):
     id: int
     owner_id: int
-    owner_username: str
\ No newline at end of file
+    created_at: datetime
+    updated_at: datetime
+    owner_username: str
+
+class BulkNoteCreated(NotePublic):
+    index: int
+
+class BulkNoteError(SQLModel):
+    index: int
+    detail: str
+
+class BulkNoteResult(SQLModel):
+    created: List[BulkNoteCreated]
+    errors: List[BulkNoteError]
+
+class NotePage(SQLModel):
+    items: List[NotePublic]
+    next_cursor: Optional[str] = None
+
+class NotePublicWithUsernamePage(SQLModel):
+    items: List[NotePublicWithUsername]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,18 @@
+from . import invalidation, models
+from .config import settings
+from .local_cache import LocalCache
+
+INVALIDATION_CHANNEL = "principal_invalidations"
+
+# Authenticated users keyed by email (the JWT subject)
+principal_cache: LocalCache[models.User] = LocalCache(
+    max_entries=settings.PRINCIPAL_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+)
+
+invalidation.subscribe(INVALIDATION_CHANNEL, principal_cache.discard, principal_cache.clear)
+
+
+async def invalidate_principal(email: str):
+    principal_cache.discard(email)
+    await invalidation.publish(INVALIDATION_CHANNEL, email)
@@ -0,0 +1,47 @@
+import json
+import logging
+import random
+from collections import Counter
+from typing import Optional
+
+from .config import settings
+
+logger = logging.getLogger("uvicorn")
+
+MAX_STATEMENT_CHARS = 2000
+
+
+def _log(event: str, **fields):
+    logger.warning(json.dumps({"event": event, **fields}, default=str))
+
+
+def record_query(route: str, statement: str, elapsed: float, statements: Optional[Counter] = None):
+    """Log a statement if it's slow or picked by sampling. Parameters are never logged,
+    they can hold note contents and emails."""
+    if statements is not None:
+        statements[statement] += 1
+
+    duration_ms = elapsed * 1000
+    slow = duration_ms >= settings.SLOW_QUERY_MS
+    if slow or (settings.QUERY_LOG_SAMPLE_RATE and random.random() < settings.QUERY_LOG_SAMPLE_RATE):
+        _log(
+            "slow_query" if slow else "sampled_query",
+            route=route,
+            duration_ms=round(duration_ms, 2),
+            statement=" ".join(statement.split())[:MAX_STATEMENT_CHARS],
+        )
+
+
+def check_request(route: str, query_count: int, statements: Counter):
+    # Many statements in one request usually means a per-row query inside a loop
+    if query_count <= settings.N_PLUS_ONE_THRESHOLD:
+        return
+
+    statement, repeats = statements.most_common(1)[0]
+    _log(
+        "n_plus_one",
+        route=route,
+        query_count=query_count,
+        most_repeated=" ".join(statement.split())[:MAX_STATEMENT_CHARS],
+        repeats=repeats,
+    )
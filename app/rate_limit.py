@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import math
+from typing import List
+
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import OAuth2PasswordRequestForm
+
+from . import auth, redis_client
+from .config import settings
+from .metrics import REQUESTS_SHED, REQUESTS_RATE_LIMITED
+
+logger = logging.getLogger("uvicorn")
+
+# One bucket per key: tokens refill continuously at ARGV[2] per second up to ARGV[1].
+# A request needs a token from every bucket it's checked against (e.g. its IP and its
+# user) and only consumes them if all of them have one.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local tokens = {}
+local retry_after = 0
+for i, key in ipairs(KEYS) do
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local available = tonumber(bucket[1]) or capacity
+    local updated = tonumber(bucket[2]) or now
+    available = math.min(capacity, available + math.max(0, now - updated) * rate)
+    tokens[i] = available
+    if available < 1 then
+        retry_after = math.max(retry_after, (1 - available) / rate)
+    end
+end
+
+if retry_after > 0 then
+    return {0, tostring(retry_after)}
+end
+
+for i, key in ipairs(KEYS) do
+    redis.call('HSET', key, 'tokens', tokens[i] - 1, 'ts', now)
+    redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+end
+return {1, '0'}
+"""
+
+
+def _client_ip(request: Request) -> str:
+    # Behind a proxy, run uvicorn with --proxy-headers so this is the real client
+    return request.client.host if request.client else "unknown"
+
+
+async def check_rate_limit(name: str, identities: List[str], per_minute: int, burst: int):
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+
+    keys = [f"ratelimit:{name}:{identity}" for identity in identities]
+    try:
+        redis = redis_client.get_redis_pool()
+        allowed, retry_after = await redis.eval(TOKEN_BUCKET_SCRIPT, len(keys), *keys, burst, per_minute / 60)
+    except Exception as e:
+        # Fail open: a Redis hiccup shouldn't lock everyone out of login
+        logger.warning(f"Rate limiter unavailable, letting request through: {e}")
+        return
+
+    if not allowed:
+        REQUESTS_RATE_LIMITED.labels(name).inc()
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests, slow down.",
+            headers={"Retry-After": str(max(1, math.ceil(float(retry_after))))},
+        )
+
+
+async def limit_login(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
+    # Per IP against spraying, per account against targeted guessing from many IPs
+    await check_rate_limit(
+        "login",
+        [f"ip:{_client_ip(request)}", f"account:{form_data.username.lower()}"],
+        settings.LOGIN_RATE_PER_MINUTE,
+        settings.LOGIN_BURST,
+    )
+
+
+async def limit_search(request: Request, email: str = Depends(auth.get_token_subject)):
+    await check_rate_limit(
+        "search",
+        [f"ip:{_client_ip(request)}", f"user:{email}"],
+        settings.SEARCH_RATE_PER_MINUTE,
+        settings.SEARCH_BURST,
+    )
+
+
+class ConcurrencyLimiter:
+    """Per-route admission control for this worker: at most `limit` requests run at
+    once, and a request that can't get a slot within `deadline_ms` gets a 503."""
+
+    def __init__(self, name: str, limit: int, deadline_ms: int):
+        self.name = name
+        self.deadline_ms = deadline_ms
+        self._slots = asyncio.Semaphore(limit)
+
+    async def __call__(self):
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.deadline_ms / 1000)
+        except asyncio.TimeoutError:
+            REQUESTS_SHED.labels(self.name).inc()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, please retry shortly.",
+                headers={"Retry-After": "1"},
+            )
+
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+
+search_slots = ConcurrencyLimiter("search", settings.SEARCH_MAX_CONCURRENCY, settings.SEARCH_QUEUE_DEADLINE_MS)
@@ -9,7 +9,8 @@ def get_redis_pool():
         redis_pool = redis.Redis(
             host=settings.REDIS_HOST,
             port=settings.REDIS_PORT,
-            decode_responses=True,
+            # Cache payloads are binary (see cache_codec), callers decode text replies themselves
+            decode_responses=False,
             encoding="utf-8",
         )
     return redis_pool
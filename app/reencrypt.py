@@ -0,0 +1,194 @@
+"""Move private notes onto the primary encryption key, in throttled batches.
+
+    python -m app.reencrypt [--restart]
+
+Converts rows still holding Fernet text and rows sealed with a retired key. To rotate:
+deploy with the new key as ENCRYPTION_KEY/ENCRYPTION_KEY_ID and the old one listed in
+ENCRYPTION_KEYS, run this once every worker is on the new config, then drop the old key.
+If BLIND_INDEX_KEY isn't set, the search tokens follow ENCRYPTION_KEY: run app.search_index
+as well.
+
+It walks note in primary-key order, one short transaction per batch, holds its pace
+to REENCRYPT_ROWS_PER_SECOND and backs off while the database is busy, so it can run
+alongside production traffic. Progress is checkpointed in Redis: an interrupted run
+resumes where it stopped, a finished run clears the checkpoint.
+"""
+import argparse
+import asyncio
+import logging
+import time
+from typing import Optional, Tuple
+
+from sqlalchemy import bindparam, func, or_, select, text, update
+from sqlalchemy.orm import sessionmaker
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import crypto, database, redis_client
+from .config import settings
+from .models import Note
+
+logger = logging.getLogger("uvicorn")
+
+LOCK_KEY = "lock:reencrypt"
+LOCK_TTL_SECONDS = 60
+
+note_table = Note.__table__
+
+convert_statement = (
+    update(note_table)
+    .where(note_table.c.id == bindparam("note_id"))
+    # Not an edit by the owner: keep updated_at instead of letting onupdate bump it
+    .values(
+        title="", content="",
+        title_enc=bindparam("sealed_title"), content_enc=bindparam("sealed_content"),
+        updated_at=note_table.c.updated_at,
+    )
+)
+
+
+def _checkpoint_key() -> str:
+    # Per target key: a new rotation starts from the beginning
+    return f"reencrypt:checkpoint:{settings.ENCRYPTION_KEY_ID}"
+
+
+def _off_primary_key() -> tuple:
+    return (
+        Note.is_public == False,
+        or_(Note.title_enc == None, func.substring(Note.title_enc, 1, crypto.HEADER_SIZE) != crypto.header),
+    )
+
+
+async def count_remaining(session: AsyncSession) -> int:
+    """Private notes still not sealed with the primary key."""
+    result = await session.exec(select(func.count()).select_from(Note).where(*_off_primary_key()))
+    remaining = result.scalar_one()
+    await session.commit()
+    return remaining
+
+
+async def convert_batch(session: AsyncSession, after_id: int, batch_size: int) -> Tuple[int, Optional[int]]:
+    """Re-encrypt up to `batch_size` rows with id > after_id that aren't on the primary key.
+
+    Rows no loaded key can decrypt are logged and left untouched; they are picked up
+    again by a later run once their key is listed in ENCRYPTION_KEYS.
+
+    Returns (rows converted, last id seen), the id being None once nothing is left.
+    """
+    statement = (
+        select(Note.id, Note.title, Note.content, Note.title_enc, Note.content_enc)
+        .where(Note.id > after_id, *_off_primary_key())
+        .order_by(Note.id)
+        .limit(batch_size)
+        # FOR NO KEY UPDATE: doesn't conflict with the FOR KEY SHARE locks FK checks take
+        # (search token inserts), and waits for other row locks instead of skipping past
+        # rows the checkpoint would then never come back to
+        .with_for_update(key_share=True)
+    )
+    rows = (await session.exec(statement)).all()
+    if not rows:
+        await session.commit()
+        return 0, None
+
+    ciphertexts = [
+        (row.title_enc, row.content_enc) if row.title_enc is not None else (row.title, row.content)
+        for row in rows
+    ]
+    # Strict: a Fernet token whose key isn't loaded would otherwise come back as is
+    # and be sealed as the note's plaintext, under the primary header for good
+    plaintexts = await crypto.try_decrypt_many([value for pair in ciphertexts for value in pair], strict=True)
+    readable = []
+    for i, row in enumerate(rows):
+        title, content = plaintexts[2 * i], plaintexts[2 * i + 1]
+        if title is None or content is None:
+            logger.warning(f"Note {row.id} can't be decrypted with any loaded key, leaving it as is")
+            continue
+        readable.append((row, title, content))
+
+    if readable:
+        sealed = await crypto.encrypt_many([value for _, title, content in readable for value in (title, content)])
+        await session.exec(convert_statement, params=[
+            {"note_id": row.id, "sealed_title": sealed[2 * i], "sealed_content": sealed[2 * i + 1]}
+            for i, (row, _, _) in enumerate(readable)
+        ])
+    await session.commit()
+    return len(readable), rows[-1].id
+
+
+async def database_busy(session: AsyncSession) -> bool:
+    result = await session.exec(text("""
+        SELECT count(*) FROM pg_stat_activity
+        WHERE state = 'active' AND datname = current_database() AND pid <> pg_backend_pid()
+    """))
+    active = result.scalar_one()
+    await session.commit()
+    return active > settings.REENCRYPT_MAX_ACTIVE_QUERIES
+
+
+async def run(restart: bool = False) -> int:
+    redis = redis_client.get_redis_pool()
+    if not await redis.set(LOCK_KEY, "1", nx=True, ex=LOCK_TTL_SECONDS):
+        logger.warning("Re-encryption is already running elsewhere")
+        return 0
+
+    if restart:
+        await redis.delete(_checkpoint_key())
+    after_id = int(await redis.get(_checkpoint_key()) or 0)
+    if after_id:
+        logger.info(f"Resuming re-encryption after note {after_id}")
+
+    async_session = sessionmaker(bind=database.engine, class_=AsyncSession, expire_on_commit=False)
+    converted = 0
+    try:
+        async with async_session() as session:
+            while True:
+                while await database_busy(session):
+                    logger.info(f"Database busy, pausing re-encryption for {settings.REENCRYPT_BACKOFF_SECONDS}s")
+                    await redis.expire(LOCK_KEY, LOCK_TTL_SECONDS)
+                    await asyncio.sleep(settings.REENCRYPT_BACKOFF_SECONDS)
+
+                start = time.monotonic()
+                count, last_id = await convert_batch(session, after_id, settings.REENCRYPT_BATCH_SIZE)
+                if last_id is None:
+                    break
+
+                after_id = last_id
+                converted += count
+                async with redis.pipeline(transaction=True) as pipe:
+                    pipe.set(_checkpoint_key(), after_id)
+                    pipe.expire(LOCK_KEY, LOCK_TTL_SECONDS)
+                    await pipe.execute()
+                logger.info(f"Re-encrypted {converted} notes (up to id {after_id})")
+
+                if settings.REENCRYPT_ROWS_PER_SECOND:
+                    await asyncio.sleep(max(0.0, count / settings.REENCRYPT_ROWS_PER_SECOND - (time.monotonic() - start)))
+
+            remaining = await count_remaining(session)
+
+        await redis.delete(_checkpoint_key())
+        if remaining:
+            # Undecryptable rows, or rows written by a worker still on the old config:
+            # the old key is still needed, the next run starts over from the first note
+            logger.warning(
+                f"Re-encryption incomplete: {converted} notes converted, {remaining} still not on "
+                f"key {settings.ENCRYPTION_KEY_ID}. Keep the old keys and run it again."
+            )
+        else:
+            logger.info(f"Re-encryption done: {converted} notes converted")
+        return converted
+    finally:
+        await redis.delete(LOCK_KEY)
+
+
+async def main(restart: bool):
+    try:
+        await run(restart)
+    finally:
+        await redis_client.close_redis_pool()
+        await database.dispose_engines()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start from the first note")
+    asyncio.run(main(parser.parse_args().restart))
@@ -6,6 +6,8 @@ from jose import jwt, JWTError
 
 from ..database import get_session
 from .. import crud, auth, models
+from ..rate_limit import limit_login
+from ..principal_cache import invalidate_principal
 from ..config import settings
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
@@ -22,24 +24,36 @@ async def register_user(user_in: models.UserCreate, db: AsyncSession = Depends(g
             detail="Email already registered.",
         )
     
-    return await crud.create_user(db, user_data=user_in)
+    new_user = await crud.create_user(db, user_data=user_in)
+    await auth.pin_to_primary(new_user.email)
+    return new_user
 
 
 # -----------------
 # 2. LOGIN
 # -----------------
-@router.post("/token", response_model=models.Token)
+@router.post("/token", response_model=models.Token, dependencies=[Depends(limit_login)])
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(),
                                  db: AsyncSession = Depends(get_session)):
     user = await crud.get_user_by_email(db, email=form_data.username)
     
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = await auth.verify_and_update_password(form_data.password, user.hashed_password)
+
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password.",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    if new_hash:
+        # Stored hash uses outdated Argon2 parameters, upgrade it transparently
+        await crud.update_user_password_hash(db, user, new_hash)
+        await invalidate_principal(user.email)
+        await auth.pin_to_primary(user.email)
+
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth.create_access_token(
         data={"sub": user.email}, expires_delta=access_token_expires
@@ -71,7 +85,7 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 @router.post("/refresh", response_model=models.Token)
 async def refresh_access_token(token_data: models.TokenRefreshRequest, db: AsyncSession = Depends(get_session)):
     try:
-        payload = jwt.decode(token_data.refresh_token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
+        payload = jwt.decode(token_data.refresh_token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         jti = payload.get("jti")
         user_id = payload.get("sub")
         
@@ -84,41 +98,31 @@ async def refresh_access_token(token_data: models.TokenRefreshRequest, db: Async
             detail="Invalid or expired refresh token.",
         )
 
-    db_token = await crud.get_valid_refresh_token(db, jti=jti)
-    if not db_token:
+    # --- TOKEN ROTATION LOGIC ---
+
+    new_jti = auth.create_refresh_token_jti()
+    new_expires_at = (datetime.now(timezone.utc) + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)).replace(tzinfo=None)
+
+    owner = await crud.rotate_refresh_token(db, jti=jti, new_jti=new_jti, new_expires_at=new_expires_at)
+    if not owner:
+        # A rotated token showing up again means it leaked: revoke everything issued from the same login
+        await crud.revoke_refresh_token_family(db, jti=jti)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Refresh token is invalid, expired, or already used.",
         )
 
+    owner_id, owner_email = owner
 
-    # --- TOKEN ROTATION LOGIC ---
-    
-    await crud.mark_refresh_token_as_used(db, token_id=db_token.id)
-
-    user = await db.get(models.User, int(user_id))
-    if not user:
-         raise HTTPException(status_code=404, detail="User not found.")
-
-    access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth.create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
-    )
-
-    new_jti = auth.create_refresh_token_jti()
-    new_expires_at = (datetime.now(timezone.utc) + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)).replace(tzinfo=None)
-
-    await crud.create_db_refresh_token(
-        session=db,
-        user_id=user.id,
-        jti=new_jti,
-        expires_at=new_expires_at
+        data={"sub": owner_email}, expires_delta=access_token_expires
     )
     
     new_refresh_token = auth.create_refresh_token(
-        user_id=user.id,
+        user_id=owner_id,
         jti=new_jti,
         expires_delta=timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
     )
 
-    return models.Token(access_token=access_token, refresh_token=new_refresh_token)
\ No newline at end of file
+    return models.Token(access_token=access_token, refresh_token=new_refresh_token)
@@ -1,13 +1,74 @@
-import json
-from typing import List
-from fastapi import APIRouter, Depends, status, HTTPException
+import hashlib
+from datetime import datetime
+from typing import Any, List, Optional
+from fastapi import APIRouter, Body, Depends, status, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from ..database import get_session
-from .. import models, crud, auth, redis_client
+from ..config import settings
+from .. import models, crud, auth, cache
+from ..rate_limit import limit_search, search_slots
+from ..pagination import DEFAULT_PAGE_SIZE, clamp_limit, decode_cursor, encode_cursor
 
 router = APIRouter(prefix="/notes", tags=["Notes"])
 
+CACHE_TTL_SECONDS = 60
+MAX_BULK_NOTES = 1000
+PUBLIC_FEED_FAMILY = "public_notes_feed"
+cache.register_local(PUBLIC_FEED_FAMILY)
+# Generation counter for every cached public search result, bumped by public writes
+PUBLIC_SEARCH_FAMILY = "public_search"
+
+
+def user_notes_family(user_id: int) -> str:
+    return f"user_notes:{user_id}"
+
+
+def normalize_query(query: str) -> str:
+    # Postgres lowercases while parsing the tsquery, so this doesn't change the results
+    return " ".join(query.lower().split())
+
+
+async def search_family(query: str, cursor: Optional[str], limit: int) -> str:
+    # "public_search:<public generation>:<digest>": a public write moves every search
+    # to keys nobody has filled yet, and the old entries just expire
+    digest = hashlib.sha256(f"{query}\x00{cursor or ''}\x00{limit}".encode()).hexdigest()[:32]
+    return f"{await cache.current_key(PUBLIC_SEARCH_FAMILY)}:{digest}"
+
+
+def cached_json_response(payload: bytes) -> Response:
+    # Cached payloads are already the serialized response model; skip parsing,
+    # response_model validation and re-serialization
+    return Response(content=payload, media_type="application/json")
+
+
+def append_to_my_notes(payload: bytes, note: models.NotePublic) -> bytes:
+    # My notes are ordered oldest first, so a new note only lands on a first page that isn't full
+    page = models.NotePage.model_validate_json(payload)
+    if page.next_cursor is not None or any(item.id == note.id for item in page.items):
+        return payload
+
+    if len(page.items) < DEFAULT_PAGE_SIZE:
+        page.items.append(models.NotePublic.model_validate(note))
+    else:
+        page.next_cursor = encode_cursor((page.items[-1].id,))
+    return page.model_dump_json().encode()
+
+
+def prepend_to_public_feed(payload: bytes, note: models.NotePublic, username: str) -> bytes:
+    page = models.NotePublicWithUsernamePage.model_validate_json(payload)
+    if any(item.id == note.id for item in page.items):
+        return payload
+
+    page.items.insert(0, models.NotePublicWithUsername(**note.model_dump(), owner_username=username))
+    if len(page.items) > DEFAULT_PAGE_SIZE:
+        page.items = page.items[:DEFAULT_PAGE_SIZE]
+        page.next_cursor = encode_cursor((page.items[-1].created_at, page.items[-1].id))
+    return page.model_dump_json().encode()
+
+
 @router.post("/", response_model=models.NotePublic, status_code=status.HTTP_201_CREATED)
 async def create_note(
     note_in: models.NoteCreate,
@@ -15,77 +76,216 @@ async def create_note(
     current_user: models.User = Depends(auth.get_current_user)
 ):
     new_note = await crud.create_note(session=db, note_in=note_in, owner_id=current_user.id)
+    await auth.pin_to_primary(current_user.email)
     
-    redis = redis_client.get_redis_pool()
-    user_cache_key = f"user_notes:{current_user.id}"
-    await redis.delete(user_cache_key)
+    # Write-through: carry the cached first pages over to the next generation with the new note in them
+    await cache.write_through(
+        user_notes_family(current_user.id),
+        lambda payload: append_to_my_notes(payload, new_note),
+    )
     
     if note_in.is_public:
-        await redis.delete("public_notes_feed")
+        await cache.write_through(
+            PUBLIC_FEED_FAMILY,
+            lambda payload: prepend_to_public_feed(payload, new_note, current_user.username),
+        )
+        await cache.invalidate(PUBLIC_SEARCH_FAMILY)
         
     return new_note
 
 
-@router.get("/", response_model=List[models.NotePublic])
-async def read_notes(
+@router.post(
+    "/bulk",
+    response_model=models.BulkNoteResult,
+    status_code=status.HTTP_201_CREATED,
+    # Items are validated one by one below, so a bad one is reported in `errors`
+    # instead of failing the request; document them as the NoteCreate they should be
+    openapi_extra={"requestBody": {"required": True, "content": {"application/json": {"schema": {
+        "type": "array", "maxItems": MAX_BULK_NOTES, "items": {"$ref": "#/components/schemas/NoteCreate"},
+    }}}}},
+)
+async def create_notes_bulk(
+    notes_in: List[Any] = Body(...),
     db: AsyncSession = Depends(get_session),
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    redis = redis_client.get_redis_pool()
-    CACHE_KEY = f"user_notes:{current_user.id}"
-    
-    cached_data = await redis.get(CACHE_KEY)
-    if cached_data:
-        print(f"My Notes - Cache Found")
-        return json.loads(cached_data)
-    
+    if len(notes_in) > MAX_BULK_NOTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {MAX_BULK_NOTES} notes per request.",
+        )
 
-    print(f"My Notes - Cache Not Found")
-    notes = await crud.get_notes_by_owner(session=db, owner_id=current_user.id)
-    notes_json = [note.model_dump(mode='json') for note in notes]
-    await redis.set(CACHE_KEY, json.dumps(notes_json), ex=60)
-    
-    return notes
+    valid_notes = []
+    valid_indexes = []
+    errors = []
+    for index, raw_note in enumerate(notes_in):
+        try:
+            valid_notes.append(models.NoteCreate.model_validate(raw_note))
+            valid_indexes.append(index)
+        except ValidationError as e:
+            detail = "; ".join(
+                f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" if err["loc"] else err["msg"]
+                for err in e.errors()
+            )
+            errors.append(models.BulkNoteError(index=index, detail=detail))
+
+    created = []
+    if valid_notes:
+        notes = await crud.create_notes_bulk(session=db, notes_in=valid_notes, owner_id=current_user.id)
+        # Report which input became which note, so a client can match them up around the errors
+        created = [
+            models.BulkNoteCreated.model_validate(note, update={"index": index})
+            for index, note in zip(valid_indexes, notes)
+        ]
+        await auth.pin_to_primary(current_user.email)
+
+        await cache.invalidate(user_notes_family(current_user.id))
+        if any(note.is_public for note in valid_notes):
+            await cache.invalidate(PUBLIC_FEED_FAMILY)
+            await cache.invalidate(PUBLIC_SEARCH_FAMILY)
+
+    return models.BulkNoteResult(created=created, errors=errors)
+
+
+@router.get("/", response_model=models.NotePage)
+async def read_notes(
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    db: AsyncSession = Depends(auth.get_read_session),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    limit = clamp_limit(limit)
+    after = decode_cursor(cursor, int)
+
+    # Only the first page with the default size is cached
+    cacheable = after is None and limit == DEFAULT_PAGE_SIZE
 
+    async def load_page() -> models.NotePage:
+        notes, next_key = await crud.get_notes_by_owner(
+            session=db,
+            owner_id=current_user.id,
+            limit=limit,
+            after_id=after[0] if after else None,
+        )
+        return models.NotePage(items=notes, next_cursor=encode_cursor(next_key))
 
-@router.get("/search", response_model=List[models.NotePublicWithUsername])
+    if not cacheable:
+        return await load_page()
+
+    async def compute() -> bytes:
+        return (await load_page()).model_dump_json().encode()
+
+    cached_data = await cache.get_or_compute(user_notes_family(current_user.id), CACHE_TTL_SECONDS, compute)
+    return cached_json_response(cached_data)
+
+
+@router.get(
+    "/search",
+    response_model=models.NotePublicWithUsernamePage,
+    dependencies=[Depends(limit_search), Depends(search_slots)],
+)
 async def search_notes(
     q: str,
-    offset: int = 0,
+    cursor: Optional[str] = None,
     limit: int = 20,
-    db: AsyncSession = Depends(get_session),
+    primary_db: AsyncSession = Depends(get_session),
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    MAX_INTERNAL_LIMIT = 100
-    
-    if limit > MAX_INTERNAL_LIMIT:
-        limit = MAX_INTERNAL_LIMIT
-
-    return await crud.search_notes(
-        session=db, 
-        query=q, 
-        owner_id=current_user.id, 
-        offset=offset, 
-        limit=limit
+    limit = clamp_limit(limit)
+    after = decode_cursor(cursor, (int, float), int)
+    query = normalize_query(q)
+
+    # Only public notes match, so results are shared by every user; identical searches
+    # in flight at once run a single query (see cache.get_or_compute). Misses run on the
+    # primary: a lagging replica would cache results from before the generation bump.
+    async def compute() -> bytes:
+        notes, next_key = await crud.search_notes(
+            session=primary_db, 
+            query=query, 
+            owner_id=current_user.id, 
+            limit=limit,
+            after=tuple(after) if after else None,
+        )
+        page = models.NotePublicWithUsernamePage(items=notes, next_cursor=encode_cursor(next_key))
+        return page.model_dump_json().encode()
+
+    family = await search_family(query, cursor, limit)
+    cached_data = await cache.get_or_compute(family, settings.SEARCH_CACHE_TTL_SECONDS, compute)
+    return cached_json_response(cached_data)
+
+
+@router.get(
+    "/search/private",
+    response_model=models.NotePage,
+    dependencies=[Depends(limit_search), Depends(search_slots)],
+)
+async def search_private_notes(
+    q: str,
+    cursor: Optional[str] = None,
+    limit: int = 20,
+    db: AsyncSession = Depends(auth.get_read_session),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    # Private notes only, matched through their blind-index tokens
+    limit = clamp_limit(limit)
+    before = decode_cursor(cursor, int)
+
+    notes, next_key = await crud.search_private_notes(
+        session=db,
+        query=q,
+        owner_id=current_user.id,
+        limit=limit,
+        before_id=before[0] if before else None,
     )
+    return models.NotePage(items=notes, next_cursor=encode_cursor(next_key))
 
 
-@router.get("/public", response_model=List[models.NotePublicWithUsername])
+@router.get("/export")
+async def export_notes(
+    db: AsyncSession = Depends(auth.get_read_session),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    # One JSON object per line, read from a server-side cursor and decrypted chunk by chunk
+    async def lines():
+        async for chunk in crud.stream_notes_by_owner(session=db, owner_id=current_user.id, chunk_size=settings.EXPORT_CHUNK_SIZE):
+            yield b"".join(note.model_dump_json().encode() + b"\n" for note in chunk)
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="notes.ndjson"'},
+    )
+
+
+@router.get("/public", response_model=models.NotePublicWithUsernamePage)
 async def read_public_notes(
-    db: AsyncSession = Depends(get_session),
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    db: AsyncSession = Depends(auth.get_read_session),
+    primary_db: AsyncSession = Depends(get_session),
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    redis = redis_client.get_redis_pool()
-    CACHE_KEY = "public_notes_feed"
-    
-    cached_data = await redis.get(CACHE_KEY)
-    if cached_data:
-        print("Public Feed - Cache Found")
-        return json.loads(cached_data)
-    
-    print("Public Feed - Cache not Found")
-    notes = await crud.get_public_notes(session=db)
-    notes_json = [note.model_dump(mode='json') for note in notes]
-    await redis.set(CACHE_KEY, json.dumps(notes_json), ex=60)
-    
-    return notes
\ No newline at end of file
+    limit = clamp_limit(limit)
+    before = decode_cursor(cursor, datetime, int)
+
+    # The feed is shared by everyone, only its first page is cached
+    cacheable = before is None and limit == DEFAULT_PAGE_SIZE
+
+    async def load_page(session: AsyncSession) -> models.NotePublicWithUsernamePage:
+        notes, next_key = await crud.get_public_notes(
+            session=session,
+            limit=limit,
+            before=tuple(before) if before else None,
+        )
+        return models.NotePublicWithUsernamePage(items=notes, next_cursor=encode_cursor(next_key))
+
+    if not cacheable:
+        return await load_page(db)
+
+    # Everyone shares this entry, so it's rebuilt from the primary: a lagging replica
+    # would overwrite the copy write_through just put there with an older feed
+    async def compute() -> bytes:
+        return (await load_page(primary_db)).model_dump_json().encode()
+
+    cached_data = await cache.get_or_compute(PUBLIC_FEED_FAMILY, CACHE_TTL_SECONDS, compute)
+    return cached_json_response(cached_data)
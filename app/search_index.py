@@ -0,0 +1,125 @@
+"""Backfill blind-index search tokens for private notes that have none, or whose
+tokens were made with another key.
+
+    python -m app.search_index
+
+New private notes are indexed when they're written; run this once after upgrading,
+and after changing BLIND_INDEX_KEY (or ENCRYPTION_KEY, while BLIND_INDEX_KEY is unset).
+Every token row records the key id it was made with, so rows from an earlier key are
+found and rebuilt; notes already on the current key are skipped, so it can be stopped
+and rerun at any time. Paced and backing off like app.reencrypt, so it can run
+alongside production traffic.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Optional, Tuple
+
+from sqlalchemy import or_, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import sessionmaker
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import crypto, database, redis_client
+from .config import settings
+from .models import Note, NoteSearchToken
+from .reencrypt import database_busy
+
+logger = logging.getLogger("uvicorn")
+
+
+async def index_batch(session: AsyncSession, after_id: int, batch_size: int) -> Tuple[int, Optional[int]]:
+    """Index up to `batch_size` private notes with id > after_id that have no tokens for the current key.
+
+    Notes no loaded key can decrypt are logged and skipped; without tokens, a later run
+    retries them.
+
+    Returns (notes indexed, last id seen), the id being None once nothing is left.
+    """
+    statement = (
+        select(Note.id, Note.owner_id, Note.title, Note.content, Note.title_enc, Note.content_enc)
+        .outerjoin(NoteSearchToken, NoteSearchToken.note_id == Note.id)
+        .where(
+            Note.is_public == False,
+            Note.id > after_id,
+            or_(NoteSearchToken.note_id == None, NoteSearchToken.key_id != crypto.search_index_key_id),
+        )
+        .order_by(Note.id)
+        .limit(batch_size)
+    )
+    rows = (await session.exec(statement)).all()
+    if not rows:
+        await session.commit()
+        return 0, None
+
+    # Strict, as in app.reencrypt: a token no loaded key can read must not be indexed as
+    # if it were the text, and stamped with the current key id it would never be retried
+    plaintexts = await crypto.try_decrypt_many([
+        value for row in rows
+        for value in ((row.title_enc, row.content_enc) if row.title_enc is not None else (row.title, row.content))
+    ], strict=True)
+    by_owner = defaultdict(list)
+    for i, row in enumerate(rows):
+        title, content = plaintexts[2 * i], plaintexts[2 * i + 1]
+        if title is None or content is None:
+            logger.warning(f"Note {row.id} can't be decrypted with any loaded key, not indexing it")
+            continue
+        by_owner[row.owner_id].append((row.id, f"{title} {content}"))
+
+    token_rows = []
+    for owner_id, notes in by_owner.items():
+        tokens = await crypto.search_tokens_many(owner_id, [text for _, text in notes])
+        token_rows.extend(
+            {"note_id": note_id, "owner_id": owner_id, "key_id": crypto.search_index_key_id, "tokens": note_tokens}
+            for (note_id, _), note_tokens in zip(notes, tokens)
+        )
+
+    if token_rows:
+        # Replace stale rows; a note created meanwhile may have indexed itself with the current key already
+        statement = insert(NoteSearchToken)
+        statement = statement.on_conflict_do_update(
+            index_elements=[NoteSearchToken.note_id],
+            set_={"key_id": statement.excluded.key_id, "tokens": statement.excluded.tokens},
+            where=NoteSearchToken.key_id != statement.excluded.key_id,
+        )
+        await session.exec(statement, params=token_rows)
+    await session.commit()
+    return len(token_rows), rows[-1].id
+
+
+async def run() -> int:
+    async_session = sessionmaker(bind=database.engine, class_=AsyncSession, expire_on_commit=False)
+    indexed = 0
+    after_id = 0
+    async with async_session() as session:
+        while True:
+            while await database_busy(session):
+                logger.info(f"Database busy, pausing search index backfill for {settings.REENCRYPT_BACKOFF_SECONDS}s")
+                await asyncio.sleep(settings.REENCRYPT_BACKOFF_SECONDS)
+
+            start = time.monotonic()
+            count, after_id = await index_batch(session, after_id, settings.SEARCH_INDEX_BATCH_SIZE)
+            if after_id is None:
+                break
+            indexed += count
+            logger.info(f"Indexed {indexed} notes (up to id {after_id})")
+
+            if settings.SEARCH_INDEX_ROWS_PER_SECOND:
+                await asyncio.sleep(max(0.0, count / settings.SEARCH_INDEX_ROWS_PER_SECOND - (time.monotonic() - start)))
+
+    logger.info(f"Search index backfill done: {indexed} notes indexed")
+    return indexed
+
+
+async def main():
+    try:
+        await run()
+    finally:
+        await redis_client.close_redis_pool()
+        await database.dispose_engines()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy import delete, select, text, tuple_
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import sessionmaker
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import database, redis_client
+from .config import settings
+from .models import RefreshToken
+
+logger = logging.getLogger("uvicorn")
+
+# refreshtoken is range-partitioned by week of expires_at, one partition per
+# week named after its Monday, plus a default partition that should stay empty
+LOCK_KEY = "lock:refresh_token_maintenance"
+PARTITION_PREFIX = "refreshtoken_p"
+DEFAULT_PARTITION = "refreshtoken_default"
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def _week_start(moment: datetime) -> datetime:
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return day - timedelta(days=day.weekday())
+
+def _partition_name(week: datetime) -> str:
+    return f"{PARTITION_PREFIX}{week:%Y%m%d}"
+
+
+async def list_partitions(session: AsyncSession) -> List[str]:
+    result = await session.exec(text("""
+        SELECT child.relname FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = 'refreshtoken'
+    """))
+    return [name for (name,) in result.all() if name.startswith(PARTITION_PREFIX)]
+
+
+async def create_partitions(session: AsyncSession, now: datetime) -> List[str]:
+    # Stay far enough ahead that no new token ever lands in the default partition
+    existing = set(await list_partitions(session))
+    week = _week_start(now)
+    horizon = now + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS, weeks=settings.TOKEN_PARTITION_WEEKS_AHEAD)
+
+    created = []
+    while week < horizon:
+        name = _partition_name(week)
+        end = week + timedelta(weeks=1)
+        if name not in existing:
+            try:
+                async with session.begin_nested():
+                    await _create_partition(session, name, week, end)
+                created.append(name)
+            except DBAPIError as e:
+                # Skip the week, the next run retries it
+                logger.error(f"Could not create refresh token partition {name}: {e}")
+        week = end
+
+    await session.commit()
+    return created
+
+
+async def _create_partition(session: AsyncSession, name: str, start: datetime, end: datetime):
+    # CREATE TABLE ... PARTITION OF fails while the default partition holds rows
+    # in the range (tokens issued before the week's partition existed), so build
+    # the table, move those rows into it, then attach it
+    await session.exec(text(f"CREATE TABLE {name} (LIKE refreshtoken INCLUDING DEFAULTS)"))
+    await session.exec(text(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION}
+            WHERE expires_at >= '{start:%Y-%m-%d}' AND expires_at < '{end:%Y-%m-%d}'
+            RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """))
+    await session.exec(text(
+        f"ALTER TABLE refreshtoken ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+    ))
+
+
+async def drop_expired_partitions(session: AsyncSession, now: datetime) -> List[str]:
+    # Every token in a partition whose week is over has expired, used or not.
+    # DROP (like a plain DETACH) takes ACCESS EXCLUSIVE on refreshtoken, and while it
+    # queues for it every login and refresh queues behind it. DETACH ... CONCURRENTLY
+    # would avoid that but isn't allowed while a default partition exists, so each drop
+    # runs in its own short transaction, gives up after a short lock wait, and the
+    # partition is retried next run.
+    dropped = []
+    for name in await list_partitions(session):
+        week = datetime.strptime(name[len(PARTITION_PREFIX):], "%Y%m%d")
+        if week + timedelta(weeks=1) > now:
+            continue
+        try:
+            async with session.begin_nested():
+                await session.exec(text(f"SET LOCAL lock_timeout = {int(settings.TOKEN_PARTITION_LOCK_TIMEOUT_MS)}"))
+                await session.exec(text(f"DROP TABLE {name}"))
+            await session.commit()
+            dropped.append(name)
+        except DBAPIError as e:
+            logger.warning(f"Could not drop refresh token partition {name}, retrying next run: {e}")
+
+    await session.commit()
+    return dropped
+
+
+async def purge_expired_tokens(session: AsyncSession, now: datetime) -> int:
+    # Rotated tokens are kept until they expire: they're what reuse detection
+    # matches a replayed token against
+    batch = (
+        select(RefreshToken.id, RefreshToken.expires_at)
+        .where(RefreshToken.expires_at <= now)
+        .limit(settings.TOKEN_PURGE_BATCH_SIZE)
+    )
+    statement = delete(RefreshToken).where(tuple_(RefreshToken.id, RefreshToken.expires_at).in_(batch))
+
+    purged = 0
+    while True:
+        result = await session.exec(statement)
+        await session.commit()
+        purged += result.rowcount
+        if result.rowcount < settings.TOKEN_PURGE_BATCH_SIZE:
+            return purged
+        await asyncio.sleep(settings.TOKEN_PURGE_BATCH_PAUSE_MS / 1000)
+
+
+async def run_once(now: Optional[datetime] = None) -> bool:
+    # The lock isn't released: it expires with the interval, so the whole
+    # deployment runs maintenance once per interval, not once per worker
+    redis = redis_client.get_redis_pool()
+    if not await redis.set(LOCK_KEY, "1", nx=True, ex=settings.TOKEN_MAINTENANCE_INTERVAL_SECONDS):
+        return False
+
+    now = now or _utcnow()
+    async_session = sessionmaker(bind=database.engine, class_=AsyncSession, expire_on_commit=False)
+    results = {}
+    async with async_session() as session:
+        # Independent steps: a failure in one (say, creating a partition) must not
+        # keep expired tokens from being dropped and purged on every later run
+        for step in (create_partitions, drop_expired_partitions, purge_expired_tokens):
+            try:
+                results[step.__name__] = await step(session, now)
+            except Exception as e:
+                await session.rollback()
+                logger.error(f"Refresh token maintenance step {step.__name__} failed: {e}")
+
+    logger.info(
+        f"Refresh token maintenance: created {results.get('create_partitions')}, "
+        f"dropped {results.get('drop_expired_partitions')}, "
+        f"purged {results.get('purge_expired_tokens')} rows"
+    )
+    return True
+
+
+async def run():
+    while True:
+        try:
+            await run_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Refresh token maintenance failed: {e}")
+        await asyncio.sleep(settings.TOKEN_MAINTENANCE_INTERVAL_SECONDS)
@@ -0,0 +1,117 @@
+"""p99 for well-behaved clients while one client hammers login and search.
+
+    python -m benchmarks.bench_abuse                          # rate limits on
+    RATE_LIMIT_ENABLED=false python -m benchmarks.bench_abuse # no limits
+
+Runs the app in-process (with its lifespan, so hashing runs on the process pool)
+against the Postgres/Redis configured in .env. The abuser and the normal users
+connect from different client IPs. The abuser sends at a fixed rate (open loop):
+client and server share one event loop here, so a closed loop spinning on instant
+429s would measure the load generator rather than the server.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+from httpx import AsyncClient, ASGITransport
+
+from app.main import app
+from app.config import settings
+from benchmarks import report
+
+
+async def register(client, password):
+    email = f"bench_{uuid.uuid4()}@example.com"
+    await client.post("/auth/register", json={
+        "email": email, "password": password, "username": f"bench_{uuid.uuid4()}"
+    })
+    res = await client.post("/auth/token", data={"username": email, "password": password})
+    return email, {"Authorization": f"Bearer {res.json()['access_token']}"}
+
+
+async def main(args):
+    async with app.router.lifespan_context(app):
+        abuser_transport = ASGITransport(app=app, client=("10.0.0.66", 1000))
+        async with AsyncClient(transport=abuser_transport, base_url="http://bench", timeout=60) as abuser_client:
+            # Normal users each have their own account and IP and stay well inside the limits
+            users = []
+            for i in range(args.users):
+                transport = ASGITransport(app=app, client=(f"10.0.1.{i + 1}", 1000))
+                client = AsyncClient(transport=transport, base_url="http://bench", timeout=60)
+                _, headers = await register(client, "benchpassword")
+                users.append((client, headers))
+            for i in range(20):
+                client, headers = users[0]
+                await client.post("/notes/", json={"title": f"python note {i}", "content": "x" * 200, "is_public": True}, headers=headers)
+            victim_email, abuser_headers = await register(abuser_client, "abuserpassword")
+
+            stop = asyncio.Event()
+            latencies = []
+            responses = {}
+            user_responses = {}
+
+            def count(counter, key):
+                counter[key] = counter.get(key, 0) + 1
+
+            async def abuse(send):
+                async def one():
+                    try:
+                        count(responses, (await send()).status_code)
+                    except Exception as e:
+                        count(responses, type(e).__name__)
+
+                pending = set()
+                while not stop.is_set():
+                    task = asyncio.create_task(one())
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+                    await asyncio.sleep(1 / args.abuse_rps)
+                await asyncio.gather(*pending)
+
+            async def normal_user(client, headers):
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    try:
+                        count(user_responses, (await client.get("/notes/", params={"limit": 10}, headers=headers)).status_code)
+                        count(user_responses, (await client.get("/notes/search", params={"q": "python"}, headers=headers)).status_code)
+                    except Exception as e:
+                        count(user_responses, type(e).__name__)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    await asyncio.sleep(args.think_ms / 1000)
+
+            tasks = [
+                asyncio.create_task(abuse(lambda: abuser_client.post(
+                    "/auth/token", data={"username": victim_email, "password": "guess"}
+                ))),
+                asyncio.create_task(abuse(lambda: abuser_client.get(
+                    "/notes/search", params={"q": "python"}, headers=abuser_headers
+                ))),
+            ]
+            tasks += [asyncio.create_task(normal_user(client, headers)) for client, headers in users]
+            await asyncio.sleep(args.duration)
+            stop.set()
+            await asyncio.gather(*tasks)
+
+            for client, _ in users:
+                await client.aclose()
+
+    print(json.dumps({
+        "rate_limit_enabled": settings.RATE_LIMIT_ENABLED,
+        "abuser_responses": responses,
+        "user_responses": user_responses,
+        "user_iterations": len(latencies),
+        "user_p50_ms": round(statistics.median(latencies), 2),
+        "user_p99_ms": round(report.percentile(latencies, 99), 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--abuse-rps", type=float, default=100.0, help="per abused endpoint")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--think-ms", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=20.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,57 @@
+"""Note creation throughput: POST /notes/ one at a time vs POST /notes/bulk.
+
+    python -m benchmarks.bench_bulk --notes 1000 --batch 500
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from httpx import AsyncClient, ASGITransport
+
+from app.main import app
+from app import redis_client
+
+
+def make_note(i: int) -> dict:
+    return {"title": f"Imported note {i}", "content": "imported content " * 20, "is_public": i % 4 == 0}
+
+
+async def main(args):
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        email = f"bench_{uuid.uuid4()}@example.com"
+        await client.post("/auth/register", json={
+            "email": email, "password": "benchpassword", "username": f"bench_{uuid.uuid4()}"
+        })
+        res = await client.post("/auth/token", data={"username": email, "password": "benchpassword"})
+        headers = {"Authorization": f"Bearer {res.json()['access_token']}"}
+
+        start = time.perf_counter()
+        for i in range(args.notes):
+            response = await client.post("/notes/", json=make_note(i), headers=headers)
+            assert response.status_code == 201
+        single = args.notes / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for offset in range(0, args.notes, args.batch):
+            batch = [make_note(i) for i in range(offset, min(offset + args.batch, args.notes))]
+            response = await client.post("/notes/bulk", json=batch, headers=headers)
+            assert response.status_code == 201 and not response.json()["errors"]
+        bulk = args.notes / (time.perf_counter() - start)
+
+    await redis_client.close_redis_pool()
+    print(json.dumps({
+        "notes": args.notes,
+        "batch": args.batch,
+        "single_notes_per_sec": round(single),
+        "bulk_notes_per_sec": round(bulk),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--notes", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=500)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,86 @@
+"""Redis memory and encode/decode cost of cached feeds, per codec and feed size.
+
+    python -m benchmarks.bench_cache_codec
+
+"legacy_json" is the previous format: json.dumps of the note dicts in a plain
+string key, read back with json.loads. The codec rows store exactly what
+cache.store writes (a hash entry) and time cache_codec.encode/decode.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import timedelta
+
+from app import cache, cache_codec, models, redis_client
+from app.config import settings
+
+WORDS = (
+    "meeting notes project deadline review python postgres redis docker deploy budget "
+    "design sprint idea draft follow up call client invoice travel booking recipe "
+    "grocery list reminder birthday password backup release migration schema index"
+).split()
+
+
+def make_page(notes: int, rng: random.Random) -> bytes:
+    now = models.utcnow()
+    items = [
+        models.NotePublicWithUsername(
+            id=100000 - i, owner_id=rng.randint(1, 500), owner_username=f"user{rng.randint(1, 500)}",
+            title=" ".join(rng.choices(WORDS, k=5)).capitalize(),
+            content=" ".join(rng.choices(WORDS, k=rng.randint(20, 80))),
+            is_public=True,
+            created_at=now - timedelta(minutes=i), updated_at=now - timedelta(minutes=i),
+        )
+        for i in range(notes)
+    ]
+    return models.NotePublicWithUsernamePage(items=items).model_dump_json().encode()
+
+
+def time_per_call(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+async def main(args):
+    redis = redis_client.get_redis_pool()
+    rng = random.Random(42)
+    report = []
+
+    for notes in args.sizes:
+        body = make_page(notes, rng)
+        as_dicts = json.loads(body)
+        row = {"notes": notes, "json_bytes": len(body)}
+
+        await redis.set("bench:legacy", json.dumps(as_dicts))
+        row["legacy_json"] = {
+            "redis_bytes": await redis.memory_usage("bench:legacy"),
+            "encode_us": round(time_per_call(lambda: json.dumps(as_dicts), args.repeat), 1),
+            "decode_us": round(time_per_call(lambda: json.loads(body), args.repeat), 1),
+        }
+
+        for compression in ("none", "zlib", "zstd"):
+            settings.CACHE_COMPRESSION = compression
+            encoded = cache_codec.encode(body)
+            await cache.store("bench:codec", body, ttl=60)
+            row[compression] = {
+                "redis_bytes": await redis.memory_usage("bench:codec"),
+                "encode_us": round(time_per_call(lambda: cache_codec.encode(body), args.repeat), 1),
+                "decode_us": round(time_per_call(lambda: cache_codec.decode(encoded), args.repeat), 1),
+            }
+
+        report.append(row)
+
+    await redis.delete("bench:legacy", "bench:codec")
+    await redis_client.close_redis_pool()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 100, 500, 1000])
+    parser.add_argument("--repeat", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
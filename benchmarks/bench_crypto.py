@@ -0,0 +1,80 @@
+"""Per-note vs batched decryption throughput.
+
+    python -m benchmarks.bench_crypto
+
+"per_note" is the old loop calling decrypt_text twice per note on the event loop;
+"batched" is crypto.decrypt_many, which goes to the thread pool above the inline threshold.
+Throughput scales with cores; the event loop stall column shows the latency other
+requests on the same worker would see meanwhile.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from app import crypto
+
+
+class StallMonitor:
+    """Ticks every millisecond and records the longest gap the event loop could not run."""
+
+    def __init__(self):
+        self.max_stall = 0.0
+        self._task = None
+
+    async def _tick(self):
+        last = time.perf_counter()
+        while True:
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            self.max_stall = max(self.max_stall, now - last - 0.001)
+            last = now
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._tick())
+        await asyncio.sleep(0)
+        return self
+
+    async def __aexit__(self, *exc):
+        await asyncio.sleep(0.002)
+        self._task.cancel()
+
+
+async def per_note_decrypt(ciphertexts):
+    # Old behaviour: each note decrypted inline, yielding to the loop only between requests
+    return [crypto.decrypt_text(text) for text in ciphertexts]
+
+
+async def measure(notes: int, size: int, repeat: int) -> dict:
+    plaintexts = ["x" * size for _ in range(notes * 2)]
+    ciphertexts = [crypto.encrypt_text(text) for text in plaintexts]
+    result = {"notes": notes, "note_bytes": size}
+
+    for name, decrypt in (("per_note", per_note_decrypt), ("batched", crypto.decrypt_many)):
+        async with StallMonitor() as monitor:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                await decrypt(ciphertexts)
+            elapsed = time.perf_counter() - start
+
+        result[f"{name}_notes_per_sec"] = round(notes * repeat / elapsed)
+        result[f"{name}_max_loop_stall_ms"] = round(monitor.max_stall * 1000, 2)
+
+    return result
+
+
+async def main(args):
+    results = []
+    for notes in args.notes:
+        for size in args.sizes:
+            results.append(await measure(notes, size, args.repeat))
+    crypto.close_crypto_pool()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--notes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 4096, 65536])
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,84 @@
+"""Requests/sec for a cached 100-note public feed.
+
+    python -m benchmarks.bench_feed_hit
+
+"legacy" mounts a copy of the previous hit path (json.loads + response_model
+validation + re-serialization) next to the real endpoint, both reading the same
+cache entry, so the two are compared on identical payloads.
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from fastapi import Depends
+from httpx import AsyncClient, ASGITransport
+
+from app.main import app
+from app import auth, cache, cache_codec, models, redis_client
+from app.routers.notes import CACHE_TTL_SECONDS, PUBLIC_FEED_FAMILY
+
+feed_key = None
+
+
+@app.get("/bench/legacy-public", response_model=models.NotePublicWithUsernamePage)
+async def legacy_public(current_user: models.User = Depends(auth.get_current_user)):
+    redis = redis_client.get_redis_pool()
+    return json.loads(cache_codec.decode(await redis.hget(feed_key, "v")))
+
+
+def feed_payload(notes: int, content_size: int) -> bytes:
+    now = models.utcnow()
+    items = [
+        models.NotePublicWithUsername(
+            id=i, owner_id=1, owner_username="bench", title=f"Public note {i}",
+            content="lorem ipsum " * (content_size // 12), is_public=True,
+            created_at=now, updated_at=now,
+        )
+        for i in range(notes, 0, -1)
+    ]
+    return models.NotePublicWithUsernamePage(items=items, next_cursor=None).model_dump_json().encode()
+
+
+async def run(client, path, headers, requests, concurrency):
+    async def worker(count):
+        for _ in range(count):
+            response = await client.get(path, headers=headers)
+            assert response.status_code == 200
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(requests // concurrency) for _ in range(concurrency)))
+    return requests / (time.perf_counter() - start)
+
+
+async def main(args):
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://bench") as client:
+        email = f"bench_{uuid.uuid4()}@example.com"
+        await client.post("/auth/register", json={
+            "email": email, "password": "benchpassword", "username": f"bench_{uuid.uuid4()}"
+        })
+        res = await client.post("/auth/token", data={"username": email, "password": "benchpassword"})
+        headers = {"Authorization": f"Bearer {res.json()['access_token']}"}
+
+        global feed_key
+        feed_key = await cache.current_key(PUBLIC_FEED_FAMILY)
+        await cache.store(feed_key, feed_payload(args.notes, args.content_size), CACHE_TTL_SECONDS * 10)
+
+        results = {}
+        for name, path in (("legacy", "/bench/legacy-public"), ("bytes", "/notes/public")):
+            await run(client, path, headers, 50, 1)
+            results[name] = round(await run(client, path, headers, args.requests, args.concurrency))
+
+    await redis_client.close_redis_pool()
+    print(json.dumps({"notes": args.notes, "content_size": args.content_size, "requests_per_sec": results}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--notes", type=int, default=100)
+    parser.add_argument("--content-size", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
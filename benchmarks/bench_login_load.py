@@ -0,0 +1,72 @@
+"""p99 of GET /notes/ while a burst of logins is running.
+
+    python -m benchmarks.bench_login_load                     # hashing pool (default)
+    HASH_POOL_WORKERS=0 python -m benchmarks.bench_login_load # hashing on the event loop
+
+Runs the app in-process against the Postgres/Redis configured in .env.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+from httpx import AsyncClient, ASGITransport
+
+from app.main import app
+from benchmarks import report
+
+
+async def main(args):
+    async with app.router.lifespan_context(app):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://bench") as client:
+            email = f"bench_{uuid.uuid4()}@example.com"
+            password = "benchpassword"
+            await client.post("/auth/register", json={
+                "email": email, "password": password, "username": f"bench_{uuid.uuid4()}"
+            })
+            res = await client.post("/auth/token", data={"username": email, "password": password})
+            headers = {"Authorization": f"Bearer {res.json()['access_token']}"}
+
+            for i in range(20):
+                await client.post("/notes/", json={"title": f"n{i}", "content": "x" * 200}, headers=headers)
+
+            stop = asyncio.Event()
+            latencies = []
+            logins = 0
+
+            async def login_loop():
+                nonlocal logins
+                while not stop.is_set():
+                    await client.post("/auth/token", data={"username": email, "password": password})
+                    logins += 1
+
+            async def reader_loop():
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    await client.get("/notes/", headers=headers)
+                    latencies.append((time.perf_counter() - start) * 1000)
+
+            tasks = [asyncio.create_task(login_loop()) for _ in range(args.logins)]
+            tasks += [asyncio.create_task(reader_loop()) for _ in range(args.readers)]
+            await asyncio.sleep(args.duration)
+            stop.set()
+            await asyncio.gather(*tasks)
+
+    print(json.dumps({
+        "concurrent_logins": args.logins,
+        "logins_completed": logins,
+        "reads": len(latencies),
+        "read_p50_ms": round(statistics.median(latencies), 2),
+        "read_p99_ms": round(report.percentile(latencies, 99), 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.0)
+    asyncio.run(main(parser.parse_args()))
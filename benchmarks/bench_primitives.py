@@ -0,0 +1,155 @@
+"""Microbenchmarks for the per-request CPU primitives: note encryption, JWTs and Argon2.
+
+    SECRET_KEY=... ENCRYPTION_KEY=... python -m benchmarks.bench_primitives --out primitives.json
+    SECRET_KEY=... ENCRYPTION_KEY=... python -m benchmarks.bench_primitives --baseline primitives.json
+
+Runs offline: no database or Redis is touched, so only the two keys are needed.
+Each case is timed for --rounds rounds of at least --min-time seconds and the best
+round is reported (least disturbed by other load). peak_alloc_bytes is the Python
+heap high-water mark of a single call measured with tracemalloc, in a separate
+pass so tracing doesn't skew the timings; memory OpenSSL allocates is not included.
+--baseline exits 1 if us_per_op or peak_alloc_bytes regress by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import time
+import tracemalloc
+from datetime import timedelta
+from typing import Callable
+
+# Settings require the database credentials even though nothing here connects
+for name in ("POSTGRES_USER", "POSTGRES_PASSWORD", "POSTGRES_DB"):
+    os.environ.setdefault(name, "bench")
+
+from jose import jwt
+
+from app import auth, crypto
+from app.config import settings
+from app.hashing import pwd_context
+
+from benchmarks import report
+
+
+def size_label(size: int) -> str:
+    for unit, scale in (("MB", 1_000_000), ("KB", 1000)):
+        if size >= scale and size % scale == 0:
+            return f"{size // scale}{unit}"
+    return f"{size}B"
+
+
+def time_call(func: Callable[[], object], min_time: float, rounds: int) -> float:
+    # Pick an iteration count that fills min_time, then keep the fastest round
+    iterations = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        iterations *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    best = elapsed / iterations
+    for _ in range(rounds - 1):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        best = min(best, (time.perf_counter() - start) / iterations)
+    return best
+
+
+def peak_alloc(func: Callable[[], object]) -> int:
+    func()  # warm up caches and lazy imports
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - before
+
+
+def measure(func: Callable[[], object], args) -> dict:
+    seconds = time_call(func, args.min_time, args.rounds)
+    return {
+        "ops_per_sec": round(1 / seconds, 1),
+        "us_per_op": round(seconds * 1e6, 2),
+        "peak_alloc_bytes": peak_alloc(func),
+    }
+
+
+def cases(args):
+    rng = random.Random(42)
+    alphabet = string.ascii_letters + string.digits + " "
+
+    for size in args.sizes:
+        plaintext = "".join(rng.choices(alphabet, k=size))
+        ciphertext = crypto.encrypt_text(plaintext)
+        sealed = crypto.encrypt_bytes(plaintext)
+        label = size_label(size)
+        # Fernet text (legacy rows) and the AES-GCM bytea format new rows are written in
+        yield f"encrypt_text/{label}", lambda plaintext=plaintext: crypto.encrypt_text(plaintext)
+        yield f"decrypt_text/{label}", lambda ciphertext=ciphertext: crypto.decrypt_text(ciphertext)
+        yield f"encrypt_bytes/{label}", lambda plaintext=plaintext: crypto.encrypt_bytes(plaintext)
+        yield f"decrypt_bytes/{label}", lambda sealed=sealed: crypto.decrypt_bytes(sealed)
+
+    access_token = auth.create_access_token({"sub": "bench@example.com"})
+    jti = auth.create_refresh_token_jti()
+    yield "create_access_token", lambda: auth.create_access_token({"sub": "bench@example.com"})
+    yield "create_refresh_token", lambda: auth.create_refresh_token(42, jti, timedelta(days=7))
+    yield "jwt_decode", lambda: jwt.decode(access_token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+
+    if not args.skip_password:
+        hashed = pwd_context.hash("bench-password")
+        yield "password_hash", lambda: pwd_context.hash("bench-password")
+        yield "password_verify", lambda: pwd_context.verify("bench-password", hashed)
+
+
+def main(args):
+    results = {}
+    for name, func in cases(args):
+        results[name] = measure(func, args)
+        print(f"{name}: {json.dumps(results[name])}", file=sys.stderr)
+
+    output = {
+        "config": {
+            "python": sys.version.split()[0],
+            "argon2_rounds": settings.ARGON2_ROUNDS,
+            "jwt_algorithm": settings.ALGORITHM,
+            "min_time": args.min_time,
+            "rounds": args.rounds,
+        },
+        "results": results,
+    }
+    print(json.dumps(output, indent=2, sort_keys=True))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(output, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        regressions = report.compare(
+            report.load(args.baseline), output, args.tolerance,
+            lower_is_better=["us_per_op", "peak_alloc_bytes"],
+        )
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per timing round")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--skip-password", action="store_true", help="leave out Argon2 (slowest cases)")
+    parser.add_argument("--out", help="also write the report to this file")
+    parser.add_argument("--baseline", help="report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed regression, 0.15 = 15%%")
+    main(parser.parse_args())
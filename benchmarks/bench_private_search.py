@@ -0,0 +1,121 @@
+"""Searching one user's private notes: blind-index lookup vs decrypting everything.
+
+    python -m benchmarks.bench_private_search --notes 20000 --other-notes 200000
+
+"decrypt_all" is what a client had to do before: stream every note of the user
+(crud.stream_notes_by_owner) and filter the plaintext. "blind_index" is
+crud.search_private_notes. Notes of other users only grow the shared token index.
+Everything is seeded inside a transaction that is rolled back at the end.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+import uuid
+
+from sqlalchemy import insert, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import crud, crypto
+from app.config import settings
+from app.models import Note, NoteSearchToken
+
+WORDS = (
+    "meeting notes project deadline review python postgres redis docker deploy budget "
+    "design sprint idea draft follow up call client invoice travel booking recipe "
+    "grocery list reminder birthday password backup release migration schema index"
+).split()
+
+TERMS = {"common": "python", "rare": "zanzibar", "two_words": "travel zanzibar"}
+
+
+async def seed_user(conn, notes: int, rng: random.Random) -> int:
+    owner_id = (await conn.execute(
+        text("""INSERT INTO "user" (username, email, is_active, is_admin, hashed_password)
+                VALUES (:name, :email, true, false, '') RETURNING id"""),
+        {"name": f"bench_{uuid.uuid4()}", "email": f"bench_{uuid.uuid4()}@example.com"},
+    )).scalar_one()
+
+    for start in range(0, notes, 5000):
+        batch = []
+        for i in range(start, min(notes, start + 5000)):
+            words = rng.choices(WORDS, k=40)
+            if i % 200 == 0:
+                words.append("zanzibar")
+            batch.append((" ".join(words[:5]), " ".join(words[5:])))
+
+        sealed = await crypto.encrypt_many([value for pair in batch for value in pair])
+        tokens = await crypto.search_tokens_many(owner_id, [f"{title} {content}" for title, content in batch])
+        ids = (await conn.execute(
+            insert(Note).returning(Note.id, sort_by_parameter_order=True),
+            [
+                {"title": "", "content": "", "title_enc": sealed[2 * i], "content_enc": sealed[2 * i + 1],
+                 "is_public": False, "owner_id": owner_id}
+                for i in range(len(batch))
+            ],
+        )).scalars().all()
+        await conn.execute(insert(NoteSearchToken), [
+            {"note_id": note_id, "owner_id": owner_id, "key_id": crypto.search_index_key_id, "tokens": note_tokens}
+            for note_id, note_tokens in zip(ids, tokens)
+        ])
+    return owner_id
+
+
+async def decrypt_all(session: AsyncSession, owner_id: int, query: str) -> list:
+    words = crypto.normalize_words(query)
+    matches = []
+    async for chunk in crud.stream_notes_by_owner(session, owner_id, settings.EXPORT_CHUNK_SIZE):
+        matches.extend(note for note in chunk if words <= crypto.normalize_words(f"{note.title} {note.content}"))
+    return matches[::-1][:20]
+
+
+async def blind_index(session: AsyncSession, owner_id: int, query: str) -> list:
+    notes, _ = await crud.search_private_notes(session, query, owner_id, limit=20)
+    return notes
+
+
+async def main(args):
+    engine = create_async_engine(settings.DATABASE_URL)
+    rng = random.Random(42)
+
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+
+        start = time.perf_counter()
+        owner_id = await seed_user(conn, args.notes, rng)
+        for _ in range(args.other_users):
+            await seed_user(conn, args.other_notes // args.other_users, rng)
+        await conn.execute(text("ANALYZE note"))
+        await conn.execute(text("ANALYZE notesearchtoken"))
+        report = {"notes": args.notes, "other_notes": args.other_notes, "seed_seconds": round(time.perf_counter() - start, 1)}
+
+        session = AsyncSession(bind=conn, join_transaction_mode="create_savepoint")
+        for term_name, query in TERMS.items():
+            expected = [note.id for note in await decrypt_all(session, owner_id, query)]
+            for name, search in (("decrypt_all", decrypt_all), ("blind_index", blind_index)):
+                timings = []
+                for _ in range(args.repeat):
+                    begin = time.perf_counter()
+                    found = await search(session, owner_id, query)
+                    timings.append((time.perf_counter() - begin) * 1000)
+                assert [note.id for note in found] == expected, name
+                report[f"{term_name}_{name}_median_ms"] = round(statistics.median(timings), 2)
+
+        await session.close()
+        await transaction.rollback()
+
+    crypto.close_crypto_pool()
+    await engine.dispose()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--notes", type=int, default=20000, help="private notes of the searching user")
+    parser.add_argument("--other-notes", type=int, default=100000)
+    parser.add_argument("--other-users", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,122 @@
+"""Public feed latency on a large, mostly private note table.
+
+    python -m benchmarks.bench_public_feed --notes 10000000
+
+Compares the unordered feed query, the id-ordered keyset query, and the
+newest-first query served by ix_note_public_feed, for the first page and for a
+page deep into the feed, with and without the index (dropped inside the same
+transaction). Seeds inside a transaction that is rolled back at the end.
+
+--public-region picks where the public notes sit: spread over the whole table, or
+packed into its oldest/newest tenth (same count either way). Scans that rely on
+public rows being evenly mixed in fall over on the clustered layouts.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.config import settings
+
+SELECT = 'SELECT note.id, note.title, "user".username FROM note JOIN "user" ON "user".id = note.owner_id'
+
+QUERIES = {
+    "unordered": {
+        "first": f"{SELECT} WHERE note.is_public LIMIT 50",
+    },
+    "id_desc": {
+        "first": f"{SELECT} WHERE note.is_public ORDER BY note.id DESC LIMIT 50",
+        "deep": f"{SELECT} WHERE note.is_public AND note.id < :before_id ORDER BY note.id DESC LIMIT 50",
+    },
+    "created_at_desc": {
+        "first": f"{SELECT} WHERE note.is_public ORDER BY note.created_at DESC, note.id DESC LIMIT 50",
+        "deep": f"""{SELECT} WHERE note.is_public AND (note.created_at, note.id) < (:before_created_at, :before_id)
+                    ORDER BY note.created_at DESC, note.id DESC LIMIT 50""",
+    },
+}
+
+
+async def main(args):
+    engine = create_async_engine(settings.DATABASE_URL)
+
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+
+        owner_id = (await conn.execute(
+            text("""INSERT INTO "user" (username, email, is_active, is_admin, hashed_password)
+                    VALUES (:name, :email, true, false, '') RETURNING id"""),
+            {"name": f"bench_{uuid.uuid4()}", "email": f"bench_{uuid.uuid4()}@example.com"},
+        )).scalar_one()
+
+        start = time.perf_counter()
+        await conn.execute(text("""
+            INSERT INTO note (title, content, is_public, owner_id, created_at, updated_at)
+            SELECT
+                'note ' || i,
+                md5(i::text),
+                CASE :region
+                    WHEN 'all' THEN i % :public_every = 0
+                    WHEN 'oldest' THEN i <= :n / 10 AND i % :dense_every = 0
+                    ELSE i > :n - :n / 10 AND i % :dense_every = 0
+                END,
+                :owner_id,
+                timezone('utc', now()) - make_interval(secs => :n - i),
+                timezone('utc', now()) - make_interval(secs => :n - i)
+            FROM generate_series(1, :n) AS i
+        """), {
+            "n": args.notes,
+            "region": args.public_region,
+            "public_every": args.public_every,
+            "dense_every": max(1, args.public_every // 10),
+            "owner_id": owner_id,
+        })
+        await conn.execute(text("ANALYZE note"))
+        seed_seconds = time.perf_counter() - start
+
+        # A cursor halfway down the public feed
+        before_id, before_created_at = (await conn.execute(text(
+            "SELECT id, created_at FROM note WHERE is_public ORDER BY created_at DESC, id DESC OFFSET :offset LIMIT 1"
+        ), {"offset": args.notes // args.public_every // 2})).one()
+        params = {"before_id": before_id, "before_created_at": before_created_at}
+
+        report = {
+            "notes": args.notes,
+            "public_every": args.public_every,
+            "public_region": args.public_region,
+            "seed_seconds": round(seed_seconds, 1),
+            "results": {},
+        }
+        for phase in ("with_index", "without_index"):
+            if phase == "without_index":
+                await conn.execute(text("DROP INDEX ix_note_public_feed"))
+
+            for query_name, pages in QUERIES.items():
+                for page_name, sql in pages.items():
+                    timings = []
+                    for _ in range(args.runs):
+                        start = time.perf_counter()
+                        await conn.execute(text(sql), params)
+                        timings.append((time.perf_counter() - start) * 1000)
+                    report["results"][f"{phase}/{query_name}/{page_name}"] = {
+                        "median_ms": round(statistics.median(timings), 2),
+                        "max_ms": round(max(timings), 2),
+                    }
+
+        await transaction.rollback()
+
+    await engine.dispose()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--notes", type=int, default=10_000_000)
+    parser.add_argument("--public-every", type=int, default=100)
+    parser.add_argument("--public-region", choices=["all", "oldest", "newest"], default="all")
+    parser.add_argument("--runs", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,98 @@
+"""Latency of POST /auth/refresh: previous multi-statement rotation vs the single CTE.
+
+    python -m benchmarks.bench_refresh
+
+"legacy" mounts a copy of the previous rotation (SELECT, get + UPDATE + commit,
+user lookup, INSERT + commit + refresh) next to the real endpoint. Each sample
+rotates the token returned by the previous one.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fastapi import Depends, HTTPException
+from httpx import AsyncClient, ASGITransport
+from jose import jwt
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.main import app
+from app import auth, models, redis_client
+from app.config import settings
+from app.database import get_session
+from benchmarks import report
+
+
+@app.post("/bench/legacy-refresh", response_model=models.Token)
+async def legacy_refresh(token_data: models.TokenRefreshRequest, db: AsyncSession = Depends(get_session)):
+    payload = jwt.decode(token_data.refresh_token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    db_token = (await db.exec(select(models.RefreshToken).where(
+        models.RefreshToken.jti == payload["jti"],
+        models.RefreshToken.is_used == False,
+        models.RefreshToken.expires_at > now,
+    ))).first()
+    if not db_token:
+        raise HTTPException(status_code=401)
+
+    token = await db.get(models.RefreshToken, (db_token.id, db_token.expires_at))
+    token.is_used = True
+    db.add(token)
+    await db.commit()
+
+    user = await db.get(models.User, int(payload["sub"]))
+    access_token = auth.create_access_token(data={"sub": user.email})
+
+    new_jti = auth.create_refresh_token_jti()
+    new_token = models.RefreshToken(
+        user_id=user.id, jti=new_jti, family_id=token.family_id,
+        expires_at=now + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+    )
+    db.add(new_token)
+    await db.commit()
+    await db.refresh(new_token)
+
+    return models.Token(access_token=access_token, refresh_token=auth.create_refresh_token(user_id=user.id, jti=new_jti))
+
+
+async def main(args):
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://bench") as client:
+        email = f"bench_{uuid.uuid4()}@example.com"
+        await client.post("/auth/register", json={
+            "email": email, "password": "benchpassword", "username": f"bench_{uuid.uuid4()}"
+        })
+        res = await client.post("/auth/token", data={"username": email, "password": "benchpassword"})
+        refresh_token = res.json()["refresh_token"]
+
+        results = {}
+        for name, path in (("legacy", "/bench/legacy-refresh"), ("cte", "/auth/refresh")):
+            latencies = []
+            for i in range(args.warmup + args.requests):
+                start = time.perf_counter()
+                response = await client.post(path, json={"refresh_token": refresh_token})
+                elapsed = (time.perf_counter() - start) * 1000
+                assert response.status_code == 200
+                refresh_token = response.json()["refresh_token"]
+                if i >= args.warmup:
+                    latencies.append(elapsed)
+
+            results[name] = {
+                "p50_ms": round(statistics.median(latencies), 2),
+                "p99_ms": round(report.percentile(latencies, 99), 2),
+            }
+
+    await redis_client.close_redis_pool()
+    print(json.dumps({"requests": args.requests, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,92 @@
+"""Full-text search latency: inline to_tsvector expression vs the stored search_vector column.
+
+    python -m benchmarks.bench_search --notes 1000000
+
+Seeds public notes inside a transaction that is rolled back at the end, so the
+database is left untouched. The old expression index is recreated for the
+comparison inside the same transaction.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.config import settings
+
+OLD_VECTOR = "to_tsvector('english', coalesce(note.title, '') || ' ' || coalesce(note.content, ''))"
+
+QUERIES = {
+    "inline_expression": f"""
+        SELECT note.id FROM note
+        WHERE note.is_public AND {OLD_VECTOR} @@ websearch_to_tsquery('english', :q)
+        ORDER BY ts_rank({OLD_VECTOR}, websearch_to_tsquery('english', :q)) DESC, note.id DESC
+        LIMIT 20
+    """,
+    "stored_column": """
+        SELECT note.id FROM note
+        WHERE note.is_public AND note.search_vector @@ websearch_to_tsquery('english', :q)
+        ORDER BY ts_rank(note.search_vector, websearch_to_tsquery('english', :q)) DESC, note.id DESC
+        LIMIT 20
+    """,
+}
+
+TERMS = {"common": "python", "rare": "zanzibar"}
+
+
+async def main(args):
+    engine = create_async_engine(settings.DATABASE_URL)
+
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+
+        owner_id = (await conn.execute(
+            text("""INSERT INTO "user" (username, email, is_active, is_admin, hashed_password)
+                    VALUES (:name, :email, true, false, '') RETURNING id"""),
+            {"name": f"bench_{uuid.uuid4()}", "email": f"bench_{uuid.uuid4()}@example.com"},
+        )).scalar_one()
+
+        start = time.perf_counter()
+        await conn.execute(text("""
+            INSERT INTO note (title, content, is_public, owner_id)
+            SELECT
+                (ARRAY['python', 'postgres', 'redis', 'docker', 'fastapi'])[1 + i % 5] || ' note ' || i,
+                CASE WHEN i % :rare_every = 0 THEN 'zanzibar ' ELSE '' END
+                    || repeat('lorem ipsum dolor sit amet consectetur ', 8) || md5(i::text),
+                true,
+                :owner_id
+            FROM generate_series(1, :n) AS i
+        """), {"n": args.notes, "rare_every": args.rare_every, "owner_id": owner_id})
+        await conn.execute(text(f"CREATE INDEX bench_old_fts ON note USING GIN ({OLD_VECTOR})"))
+        await conn.execute(text("ANALYZE note"))
+        seed_seconds = time.perf_counter() - start
+
+        report = {"notes": args.notes, "seed_seconds": round(seed_seconds, 1), "results": {}}
+        for term_name, term in TERMS.items():
+            for query_name, sql in QUERIES.items():
+                timings = []
+                for _ in range(args.runs):
+                    start = time.perf_counter()
+                    await conn.execute(text(sql), {"q": term})
+                    timings.append((time.perf_counter() - start) * 1000)
+                report["results"][f"{term_name}/{query_name}"] = {
+                    "median_ms": round(statistics.median(timings), 2),
+                    "max_ms": round(max(timings), 2),
+                }
+
+        await transaction.rollback()
+
+    await engine.dispose()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--notes", type=int, default=1_000_000)
+    parser.add_argument("--rare-every", type=int, default=10_000)
+    parser.add_argument("--runs", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
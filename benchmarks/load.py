@@ -0,0 +1,237 @@
+"""End-to-end load test: seed a dataset, drive each endpoint with concurrent clients,
+report throughput and p50/p95/p99 per endpoint as JSON.
+
+    python -m benchmarks.load                                   # in-process app
+    python -m benchmarks.load --base-url http://127.0.0.1:8000  # running uvicorn
+    python -m benchmarks.load --out run.json
+    python -m benchmarks.load --baseline run.json               # exit 1 on regression
+
+Needs the Postgres and Redis from .env; POSTGRES_HOST / REDIS_HOST point it at local
+instances instead of the compose service names. Seeded rows are tagged with a run id
+and deleted afterwards (unless --keep). Rate limits are switched off for in-process
+runs; start an external server with RATE_LIMIT_ENABLED=false.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import delete, insert
+
+from app import crypto, database, redis_client
+from app.config import settings
+from app.hashing import pwd_context
+from app.main import app
+from app.models import Note, RefreshToken, User, utcnow
+
+from benchmarks import report
+
+PASSWORD = "loadtest-password"
+
+WORDS = (
+    "python postgres redis docker fastapi meeting notes todo project weekly review "
+    "design sprint idea draft follow up call client invoice travel booking recipe "
+    "grocery list reminder birthday password backup release migration schema index"
+).split()
+
+ENDPOINTS = ["token", "refresh", "my_notes", "public_feed", "search", "create_note"]
+
+
+def sentence(rng: random.Random, size: int) -> str:
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:size]
+
+
+async def seed(args, run_id: str) -> list:
+    rng = random.Random(args.seed)
+    hashed_password = pwd_context.hash(PASSWORD)
+
+    async with database.engine.begin() as conn:
+        users = [
+            {
+                "username": f"load_{run_id}_{i}", "email": f"load_{run_id}_{i}@example.com",
+                "is_active": True, "is_admin": False, "hashed_password": hashed_password,
+            }
+            for i in range(args.users)
+        ]
+        result = await conn.execute(insert(User).returning(User.id, User.email, sort_by_parameter_order=True), users)
+        seeded = [tuple(row) for row in result]
+
+    batch = []
+    for user_id, _ in seeded:
+        for _ in range(args.notes_per_user):
+            batch.append({
+                "title": sentence(rng, 40), "content": sentence(rng, args.content_size),
+                "is_public": rng.random() < args.public_ratio, "owner_id": user_id,
+            })
+            if len(batch) >= 5000:
+                await insert_notes(batch)
+                batch = []
+    if batch:
+        await insert_notes(batch)
+
+    return seeded
+
+
+async def insert_notes(rows: list):
+    private = [row for row in rows if not row["is_public"]]
+    ciphertexts = await crypto.encrypt_many([text for row in private for text in (row["title"], row["content"])])
+    now = utcnow()
+    for row in rows:
+        row.update(title_enc=None, content_enc=None, created_at=now, updated_at=now)
+    for i, row in enumerate(private):
+        row.update(title="", content="", title_enc=ciphertexts[2 * i], content_enc=ciphertexts[2 * i + 1])
+
+    async with database.engine.begin() as conn:
+        await conn.execute(insert(Note), rows)
+
+
+async def cleanup(seeded: list):
+    user_ids = [user_id for user_id, _ in seeded]
+    async with database.engine.begin() as conn:
+        await conn.execute(delete(Note).where(Note.owner_id.in_(user_ids)))
+        await conn.execute(delete(RefreshToken).where(RefreshToken.user_id.in_(user_ids)))
+        await conn.execute(delete(User).where(User.id.in_(user_ids)))
+
+
+async def login(client: AsyncClient, email: str) -> dict:
+    response = await client.post("/auth/token", data={"username": email, "password": PASSWORD})
+    response.raise_for_status()
+    return response.json()
+
+
+async def drive(client: AsyncClient, endpoint: str, seeded: list, sessions: list, args) -> dict:
+    rng = random.Random(f"{args.seed}-{endpoint}")
+    deadline = time.perf_counter() + args.duration
+    latencies = []
+    statuses = {}
+
+    async def worker(worker_id: int):
+        tokens = None
+        if endpoint == "refresh":
+            # Every worker rotates its own chain
+            tokens = await login(client, seeded[worker_id % len(seeded)][1])
+
+        while time.perf_counter() < deadline:
+            headers = {"Authorization": f"Bearer {rng.choice(sessions)['access_token']}"}
+            start = time.perf_counter()
+
+            if endpoint == "token":
+                response = await client.post(
+                    "/auth/token", data={"username": rng.choice(seeded)[1], "password": PASSWORD}
+                )
+            elif endpoint == "refresh":
+                response = await client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+                if response.status_code == 200:
+                    tokens = response.json()
+            elif endpoint == "my_notes":
+                response = await client.get("/notes/", headers=headers)
+            elif endpoint == "public_feed":
+                response = await client.get("/notes/public", headers=headers)
+            elif endpoint == "search":
+                response = await client.get("/notes/search", params={"q": rng.choice(WORDS)}, headers=headers)
+            else:
+                response = await client.post("/notes/", headers=headers, json={
+                    "title": sentence(rng, 40), "content": sentence(rng, args.content_size),
+                    "is_public": rng.random() < args.public_ratio,
+                })
+
+            elapsed = (time.perf_counter() - start) * 1000
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.is_success:
+                latencies.append(elapsed)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+    summary = report.summarize(latencies, time.perf_counter() - start)
+    summary["errors"] = sum(count for code, count in statuses.items() if code >= 400)
+    summary["statuses"] = {str(code): count for code, count in sorted(statuses.items())}
+    return summary
+
+
+async def run(args, client: AsyncClient, seeded: list) -> dict:
+    sessions = [await login(client, email) for _, email in seeded[:args.login_users]]
+    results = {}
+    for endpoint in args.endpoints:
+        results[endpoint] = await drive(client, endpoint, seeded, sessions, args)
+        print(f"{endpoint}: {json.dumps(results[endpoint])}", file=sys.stderr)
+    return results
+
+
+async def main(args):
+    run_id = uuid.uuid4().hex[:8]
+    seed_start = time.perf_counter()
+    seeded = await seed(args, run_id)
+    seed_seconds = time.perf_counter() - seed_start
+
+    try:
+        if args.base_url:
+            async with AsyncClient(base_url=args.base_url, timeout=60) as client:
+                results = await run(args, client, seeded)
+        else:
+            settings.RATE_LIMIT_ENABLED = False
+            async with app.router.lifespan_context(app):
+                transport = ASGITransport(app=app)
+                async with AsyncClient(transport=transport, base_url="http://load", timeout=60) as client:
+                    results = await run(args, client, seeded)
+    finally:
+        if not args.keep:
+            await cleanup(seeded)
+        await redis_client.close_redis_pool()
+        await database.dispose_engines()
+
+    output = {
+        "config": {
+            "target": args.base_url or "in-process",
+            "users": args.users,
+            "notes_per_user": args.notes_per_user,
+            "public_ratio": args.public_ratio,
+            "content_size": args.content_size,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "seed_seconds": round(seed_seconds, 1),
+        },
+        "results": results,
+    }
+    print(json.dumps(output, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(output, f, indent=2)
+
+    if args.baseline:
+        regressions = report.compare(
+            report.load(args.baseline), output, args.tolerance,
+            lower_is_better=["p95_ms", "p99_ms"], higher_is_better=["throughput_rps"],
+        )
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", help="drive a running server instead of the in-process app")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--notes-per-user", type=int, default=100)
+    parser.add_argument("--public-ratio", type=float, default=0.2)
+    parser.add_argument("--content-size", type=int, default=500)
+    parser.add_argument("--login-users", type=int, default=20, help="users holding access tokens for the note endpoints")
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=ENDPOINTS)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per endpoint")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="keep the seeded rows")
+    parser.add_argument("--out", help="also write the report to this file")
+    parser.add_argument("--baseline", help="report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression, 0.2 = 20%%")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,52 @@
+"""Shared helpers for benchmark reports: percentiles, summaries and baseline comparison.
+
+A report is a JSON object whose "results" map a name to a dict of numbers. Comparing
+two reports checks the given metrics of every result present in both.
+"""
+import json
+import statistics
+from typing import Dict, Iterable, List, Sequence
+
+
+def percentile(samples: Sequence[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(latencies_ms: Sequence[float], seconds: float) -> dict:
+    if not latencies_ms:
+        return {"requests": 0, "throughput_rps": 0.0}
+    return {
+        "requests": len(latencies_ms),
+        "throughput_rps": round(len(latencies_ms) / seconds, 1),
+        "p50_ms": round(statistics.median(latencies_ms), 2),
+        "p95_ms": round(percentile(latencies_ms, 95), 2),
+        "p99_ms": round(percentile(latencies_ms, 99), 2),
+    }
+
+
+def compare(
+    baseline: dict,
+    current: dict,
+    tolerance: float,
+    lower_is_better: Iterable[str] = (),
+    higher_is_better: Iterable[str] = (),
+) -> List[str]:
+    """Return one line per metric that regressed by more than `tolerance` (0.2 = 20%)."""
+    regressions = []
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        for metric in lower_is_better:
+            if metric in result and metric in before and result[metric] > before[metric] * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {before[metric]} -> {result[metric]}")
+        for metric in higher_is_better:
+            if metric in result and metric in before and result[metric] < before[metric] * (1 - tolerance):
+                regressions.append(f"{name}: {metric} {before[metric]} -> {result[metric]}")
+    return regressions
+
+
+def load(path: str) -> Dict:
+    with open(path) as f:
+        return json.load(f)
@@ -155,7 +155,7 @@ def view_public_feed():
         response = requests.get(f"{BASE_URL}/notes/public", headers=get_auth_headers())
         
         if response.status_code == 200:
-            notes = response.json()
+            notes = response.json()["items"]
             if not notes:
                 print("No public notes available yet.")
                 return
@@ -198,7 +198,7 @@ def search_notes():
         )
         
         if response.status_code == 200:
-            notes = response.json()
+            notes = response.json()["items"]
             if not notes:
                 print(f"No notes found matching '{query}'.")
             else:
@@ -232,7 +232,7 @@ def view_my_notes():
         response = requests.get(f"{BASE_URL}/notes/", headers=get_auth_headers())
         
         if response.status_code == 200:
-            notes = response.json()
+            notes = response.json()["items"]
             if not notes:
                 print("No notes found.")
             for note in notes:
@@ -12,6 +12,7 @@ def generate_env_file():
 
     secret_key = secrets.token_urlsafe(64)
     encryption_key = base64.urlsafe_b64encode(os.urandom(32)).decode()
+    blind_index_key = secrets.token_urlsafe(32)
 
 
     env_content = f"""POSTGRES_USER=postgres
@@ -23,6 +24,7 @@ REDIS_PORT=6379
 # Security Keys (Auto Generated)
 SECRET_KEY={secret_key}
 ENCRYPTION_KEY={encryption_key}
+BLIND_INDEX_KEY={blind_index_key}
 """
 
     with open(file_path, "w") as f:
@@ -32,6 +34,7 @@ ENCRYPTION_KEY={encryption_key}
     print("Generated Keys:")
     print(f"   -> SECRET_KEY: {secret_key[:10]}...")
     print(f"   -> ENCRYPTION_KEY: {encryption_key[:10]}...")
+    print(f"   -> BLIND_INDEX_KEY: {blind_index_key[:10]}...")
     print("\n🚀 You can run 'docker-compose up -d --build' now.")
 
 if __name__ == "__main__":
@@ -8,13 +8,15 @@ from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import NullPool
 
-from app import redis_client
+from app import redis_client, cache
+from app.metrics import instrument_engine
 
 engine_test = create_async_engine(
     settings.DATABASE_URL, 
     echo=False,
     poolclass=NullPool 
 )
+instrument_engine(engine_test, "test")
 
 @pytest.fixture(scope="function")
 async def session():
@@ -50,5 +52,6 @@ async def client(session):
 async def clear_redis():
     redis = redis_client.get_redis_pool()
     await redis.flushdb()
+    cache.l1.clear()
     yield
     await redis_client.close_redis_pool()
\ No newline at end of file
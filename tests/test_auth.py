@@ -1,6 +1,22 @@
+import asyncio
 import pytest
-from httpx import AsyncClient
+from httpx import AsyncClient, ASGITransport
 import uuid
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from sqlalchemy import delete, text
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import crud, hashing, invalidation, redis_client, token_maintenance
+from app.config import settings
+from app.main import app
+from app.principal_cache import principal_cache, INVALIDATION_CHANNEL
+from app.models import RefreshToken, User
+from app.rate_limit import ConcurrencyLimiter
+from tests.conftest import engine_test
 
 def random_email():
     return f"test_{uuid.uuid4()}@example.com"
@@ -57,4 +73,288 @@ async def test_login_user(client: AsyncClient):
     data = response.json()
     assert "access_token" in data
     assert "refresh_token" in data
-    assert data["token_type"] == "bearer"
\ No newline at end of file
+    assert data["token_type"] == "bearer"
+
+@pytest.mark.asyncio
+async def test_login_rehashes_outdated_password(client: AsyncClient, session: AsyncSession):
+    email = random_email()
+    password = "mypassword"
+
+    await client.post("/auth/register", json={
+        "email": email, "password": password, "username": f"user_{uuid.uuid4()}"
+    })
+
+    user = (await session.exec(select(User).where(User.email == email))).first()
+    weak_hash = CryptContext(schemes=["argon2"], argon2__rounds=1).hash(password)
+    user.hashed_password = weak_hash
+    session.add(user)
+    await session.commit()
+
+    response = await client.post("/auth/token", data={"username": email, "password": password})
+    assert response.status_code == 200
+
+    await session.refresh(user)
+    assert user.hashed_password != weak_hash
+    assert not hashing.pwd_context.needs_update(user.hashed_password)
+
+
+@pytest.mark.asyncio
+async def test_login_sheds_load_when_hash_queue_full(client: AsyncClient, monkeypatch):
+    email = random_email()
+    password = "mypassword"
+
+    await client.post("/auth/register", json={
+        "email": email, "password": password, "username": f"user_{uuid.uuid4()}"
+    })
+
+    monkeypatch.setattr(hashing, "in_flight", 10_000)
+
+    response = await client.post("/auth/token", data={"username": email, "password": password})
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+
+
+@pytest.mark.asyncio
+async def test_principal_cache_skips_user_lookup(client: AsyncClient):
+    email = random_email()
+    password = "mypassword"
+
+    await client.post("/auth/register", json={
+        "email": email, "password": password, "username": f"user_{uuid.uuid4()}"
+    })
+    response = await client.post("/auth/token", data={"username": email, "password": password})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    await client.get("/notes/", headers=headers)
+    hits_before = principal_cache.hits
+
+    response = await client.get("/notes/", headers=headers)
+    assert response.status_code == 200
+    assert principal_cache.hits == hits_before + 1
+
+
+@pytest.mark.asyncio
+async def test_principal_invalidation_is_broadcast():
+    email = random_email()
+    listener = asyncio.create_task(invalidation.listen())
+    redis = redis_client.get_redis_pool()
+
+    while (await redis.pubsub_numsub(INVALIDATION_CHANNEL))[0][1] == 0:
+        await asyncio.sleep(0.01)
+
+    principal_cache.set(email, User(email=email, username="cached", hashed_password=""), principal_cache.version)
+    assert principal_cache.get(email) is not None
+
+    await redis.publish(INVALIDATION_CHANNEL, email)
+    for _ in range(100):
+        if principal_cache.get(email) is None:
+            break
+        await asyncio.sleep(0.01)
+
+    listener.cancel()
+    assert principal_cache.get(email) is None
+
+
+async def login(client: AsyncClient) -> dict:
+    email = random_email()
+    password = "mypassword"
+    await client.post("/auth/register", json={
+        "email": email, "password": password, "username": f"user_{uuid.uuid4()}"
+    })
+    response = await client.post("/auth/token", data={"username": email, "password": password})
+    return response.json()
+
+
+@pytest.mark.asyncio
+async def test_refresh_rotates_token(client: AsyncClient):
+    tokens = await login(client)
+
+    response = await client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200
+    rotated = response.json()
+    assert rotated["refresh_token"] != tokens["refresh_token"]
+
+    headers = {"Authorization": f"Bearer {rotated['access_token']}"}
+    assert (await client.get("/notes/", headers=headers)).status_code == 200
+
+    response = await client.post("/auth/refresh", json={"refresh_token": rotated["refresh_token"]})
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_refresh_reuse_revokes_family(client: AsyncClient):
+    tokens = await login(client)
+    rotated = (await client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})).json()
+
+    # Replaying the rotated token kills the whole chain, including the legitimate newer token
+    response = await client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 401
+
+    response = await client.post("/auth/refresh", json={"refresh_token": rotated["refresh_token"]})
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_concurrent_refresh_rotates_once():
+    # Each rotation needs its own connection and committed data to really race
+    make_session = sessionmaker(bind=engine_test, class_=AsyncSession, expire_on_commit=False)
+    jti = str(uuid.uuid4())
+    expires_at = (datetime.now(timezone.utc) + timedelta(days=1)).replace(tzinfo=None)
+
+    async with make_session() as setup:
+        user = User(email=random_email(), username=f"user_{uuid.uuid4()}", hashed_password="")
+        setup.add(user)
+        await setup.commit()
+        await crud.create_db_refresh_token(setup, user_id=user.id, jti=jti, expires_at=expires_at)
+
+    async def rotate():
+        async with make_session() as session:
+            return await crud.rotate_refresh_token(session, jti=jti, new_jti=str(uuid.uuid4()), new_expires_at=expires_at)
+
+    try:
+        results = await asyncio.gather(*(rotate() for _ in range(5)))
+
+        assert [result for result in results if result] == [(user.id, user.email)]
+        async with make_session() as check:
+            family = (await check.exec(select(RefreshToken).where(RefreshToken.family_id == jti))).all()
+        assert len(family) == 2
+        assert [token.is_used for token in family if token.jti == jti] == [True]
+    finally:
+        async with make_session() as cleanup:
+            await cleanup.exec(delete(RefreshToken).where(RefreshToken.user_id == user.id))
+            await cleanup.exec(delete(User).where(User.id == user.id))
+            await cleanup.commit()
+
+
+@pytest.mark.asyncio
+async def test_token_maintenance_purges_expired_tokens(session: AsyncSession):
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    user = User(email=random_email(), username=f"user_{uuid.uuid4()}", hashed_password="")
+    session.add(user)
+    await session.commit()
+
+    tokens = {
+        "expired": (now - timedelta(hours=1), False),
+        "expired_used": (now - timedelta(hours=1), True),
+        "rotated": (now + timedelta(days=1), True),
+        "live": (now + timedelta(days=1), False),
+    }
+    for jti, (expires_at, is_used) in tokens.items():
+        jti = f"{jti}-{uuid.uuid4()}"
+        session.add(RefreshToken(user_id=user.id, jti=jti, family_id=jti, expires_at=expires_at, is_used=is_used))
+    await session.commit()
+
+    assert await token_maintenance.purge_expired_tokens(session, now) >= 2
+
+    remaining = (await session.exec(select(RefreshToken).where(RefreshToken.user_id == user.id))).all()
+    assert sorted(token.jti.split("-")[0] for token in remaining) == ["live", "rotated"]
+
+
+@pytest.mark.asyncio
+async def test_token_maintenance_rolls_partitions(session: AsyncSession):
+    later = datetime(2031, 6, 4, 12, 0)
+    created = await token_maintenance.create_partitions(session, later)
+    assert "refreshtoken_p20310602" in created
+    assert "refreshtoken_p20310602" in await token_maintenance.list_partitions(session)
+
+    dropped = await token_maintenance.drop_expired_partitions(session, later)
+    partitions = await token_maintenance.list_partitions(session)
+    assert dropped and all(name < "refreshtoken_p20310602" for name in dropped)
+    assert min(partitions) == "refreshtoken_p20310602"
+    assert max(partitions) >= token_maintenance._partition_name(
+        token_maintenance._week_start(later + timedelta(days=7))
+    )
+
+
+@pytest.mark.asyncio
+async def test_token_maintenance_drop_gives_up_on_a_busy_table(session: AsyncSession, monkeypatch):
+    monkeypatch.setattr(settings, "TOKEN_PARTITION_LOCK_TIMEOUT_MS", 50)
+    async with engine_test.connect() as other:
+        # A long transaction reading refreshtoken holds a lock DROP has to wait for
+        await other.execute(text("LOCK TABLE refreshtoken IN ACCESS SHARE MODE"))
+        assert await token_maintenance.drop_expired_partitions(session, datetime(2031, 6, 4)) == []
+        await other.rollback()
+
+    assert await token_maintenance.list_partitions(session)
+
+
+@pytest.mark.asyncio
+async def test_token_maintenance_moves_default_rows_into_new_partition(session: AsyncSession):
+    user = User(email=random_email(), username=f"user_{uuid.uuid4()}", hashed_password="")
+    session.add(user)
+    await session.commit()
+
+    # Issued before its week's partition exists, so it lands in the default partition
+    jti = str(uuid.uuid4())
+    session.add(RefreshToken(user_id=user.id, jti=jti, family_id=jti, expires_at=datetime(2032, 3, 10), is_used=False))
+    await session.commit()
+
+    created = await token_maintenance.create_partitions(session, datetime(2032, 3, 3))
+    assert "refreshtoken_p20320308" in created
+
+    result = await session.exec(text("SELECT tableoid::regclass::text FROM refreshtoken WHERE jti = :jti"), params={"jti": jti})
+    assert result.scalar_one() == "refreshtoken_p20320308"
+
+
+@pytest.mark.asyncio
+async def test_token_maintenance_steps_run_independently(monkeypatch):
+    calls = []
+
+    async def failing_step(session, now):
+        calls.append("create")
+        raise RuntimeError("partition overlaps default")
+
+    def step(name):
+        async def run(session, now):
+            calls.append(name)
+            return []
+        return run
+
+    monkeypatch.setattr(token_maintenance, "create_partitions", failing_step)
+    monkeypatch.setattr(token_maintenance, "drop_expired_partitions", step("drop"))
+    monkeypatch.setattr(token_maintenance, "purge_expired_tokens", step("purge"))
+
+    assert await token_maintenance.run_once()
+    assert calls == ["create", "drop", "purge"]
+
+
+@pytest.mark.asyncio
+async def test_login_is_rate_limited(client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(settings, "LOGIN_BURST", 2)
+    monkeypatch.setattr(settings, "LOGIN_RATE_PER_MINUTE", 1)
+
+    email = random_email()
+    await client.post("/auth/register", json={
+        "email": email, "password": "mypassword", "username": f"user_{uuid.uuid4()}"
+    })
+
+    statuses = []
+    for _ in range(3):
+        response = await client.post("/auth/token", data={"username": email, "password": "wrong"})
+        statuses.append(response.status_code)
+
+    assert statuses == [401, 401, 429]
+    assert int(response.headers["Retry-After"]) >= 1
+
+    # The account bucket is empty too, so another IP can't keep guessing this password
+    other_transport = ASGITransport(app=app, client=("10.0.0.2", 1234))
+    async with AsyncClient(transport=other_transport, base_url="http://test") as other_client:
+        response = await other_client.post("/auth/token", data={"username": email, "password": "wrong"})
+    assert response.status_code == 429
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limiter_sheds_after_deadline():
+    limiter = ConcurrencyLimiter("test", limit=1, deadline_ms=50)
+    holder = limiter()
+    await holder.__anext__()
+
+    with pytest.raises(HTTPException) as exc_info:
+        await limiter().__anext__()
+    assert exc_info.value.status_code == 503
+    assert exc_info.value.headers["Retry-After"] == "1"
+
+    await holder.aclose()
+    waiter = limiter()
+    await waiter.__anext__()
+    await waiter.aclose()
@@ -1,10 +1,19 @@
+import asyncio
+import json
 import pytest
+import tracemalloc
 import uuid
+from datetime import timedelta
+from cryptography.fernet import Fernet
 from httpx import AsyncClient
-from app import redis_client
-from app.crypto import decrypt_text
-
-from app.models import Note
+from app import redis_client, cache, cache_codec, invalidation, crud, crypto, database, reencrypt, search_index
+from app.config import settings
+from app.crypto import decrypt_bytes, encrypt_text, encrypt_many, decrypt_many
+
+from app.models import Note, NoteSearchToken
+from sqlalchemy import text, update
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
 from sqlmodel import select
 
 from sqlmodel.ext.asyncio.session import AsyncSession
@@ -66,7 +75,7 @@ async def test_read_my_notes(client: AsyncClient):
     response = await client.get("/notes/", headers=headers)
 
     assert response.status_code == 200
-    data = response.json()
+    data = response.json()["items"]
     assert len(data) == 2
     assert data[0]["title"] == "Note 1"
 
@@ -91,7 +100,7 @@ async def test_public_feed_privacy(client: AsyncClient):
     response = await client.get("/notes/public", headers=headers_b)
 
     assert response.status_code == 200
-    data = response.json()
+    data = response.json()["items"]
 
     titles = [note["title"] for note in data]
     assert "Public Title" in titles
@@ -115,14 +124,49 @@ async def test_search_pagination_limit(client: AsyncClient):
     
     res_limit = await client.get("/notes/search", params={"q": unique_tag, "limit": 5}, headers=headers)
     assert res_limit.status_code == 200
-    assert len(res_limit.json()) == 5
+    assert len(res_limit.json()["items"]) == 5
     
-    res_offset = await client.get("/notes/search", params={"q": unique_tag, "offset": 10}, headers=headers)
-    assert len(res_offset.json()) == 5
+    seen_ids = []
+    cursor = None
+    while True:
+        params = {"q": unique_tag, "limit": 5}
+        if cursor:
+            params["cursor"] = cursor
+        page = (await client.get("/notes/search", params=params, headers=headers)).json()
+        seen_ids += [note["id"] for note in page["items"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    assert len(seen_ids) == 15
+    assert len(set(seen_ids)) == 15
     
     res_abuse = await client.get("/notes/search", params={"q": unique_tag, "limit": 1000}, headers=headers)
     assert res_abuse.status_code == 200
-    assert len(res_abuse.json()) <= 200
+    assert len(res_abuse.json()["items"]) <= 200
+
+
+@pytest.mark.asyncio
+async def test_my_notes_keyset_pagination(client: AsyncClient):
+    headers = await get_auth_headers(client)
+
+    for i in range(7):
+        await client.post(
+            "/notes/",
+            json={"title": f"Note {i}", "content": "...", "is_public": i % 2 == 0},
+            headers=headers,
+        )
+
+    first = (await client.get("/notes/", params={"limit": 4}, headers=headers)).json()
+    assert [n["title"] for n in first["items"]] == ["Note 0", "Note 1", "Note 2", "Note 3"]
+    assert first["next_cursor"]
+
+    second = (await client.get("/notes/", params={"limit": 4, "cursor": first["next_cursor"]}, headers=headers)).json()
+    assert [n["title"] for n in second["items"]] == ["Note 4", "Note 5", "Note 6"]
+    assert second["next_cursor"] is None
+
+    res_bad = await client.get("/notes/", params={"cursor": "not-a-cursor"}, headers=headers)
+    assert res_bad.status_code == 400
 
 
 
@@ -130,9 +174,6 @@ async def test_search_pagination_limit(client: AsyncClient):
 async def test_public_feed_caching(client: AsyncClient):
     headers = await get_auth_headers(client)
     redis = redis_client.get_redis_pool()
-    CACHE_KEY = "public_notes_feed"
-
-    await redis.delete(CACHE_KEY)
 
     await client.post(
         "/notes/", 
@@ -143,7 +184,8 @@ async def test_public_feed_caching(client: AsyncClient):
     res1 = await client.get("/notes/public", headers=headers)
     assert res1.status_code == 200
     
-    is_cached = await redis.exists(CACHE_KEY)
+    cache_key = await cache.current_key("public_notes_feed")
+    is_cached = await redis.exists(cache_key)
     assert is_cached == 1, "Public feed was not cached"
 
     await client.post(
@@ -152,10 +194,34 @@ async def test_public_feed_caching(client: AsyncClient):
         headers=headers
     )
 
-    is_cached_after = await redis.exists(CACHE_KEY)
-    assert is_cached_after == 0, "Cache was not deleted properly"
-    
-    
+    new_cache_key = await cache.current_key("public_notes_feed")
+    assert new_cache_key != cache_key, "Feed generation was not bumped"
+
+    cached_feed = json.loads(cache_codec.decode(await redis.hget(new_cache_key, "v")))
+    assert cached_feed["items"][0]["title"] == "New Note", "New note was not written through"
+
+    res2 = await client.get("/notes/public", headers=headers)
+    assert res2.json()["items"][0]["title"] == "New Note"
+
+
+@pytest.mark.asyncio
+async def test_my_notes_write_through(client: AsyncClient):
+    headers = await get_auth_headers(client)
+    redis = redis_client.get_redis_pool()
+
+    await client.post("/notes/", json={"title": "First", "content": "A", "is_public": False}, headers=headers)
+    await client.get("/notes/", headers=headers)
+    await client.post("/notes/", json={"title": "Second", "content": "B", "is_public": False}, headers=headers)
+
+    keys = await redis.keys("user_notes:*")
+    live_key = max(keys, key=lambda key: int(key.rsplit(b":", 1)[1]))
+    cached = cache_codec.decode(await redis.hget(live_key, "v"))
+    assert [note["title"] for note in json.loads(cached)["items"]] == ["First", "Second"]
+
+    response = await client.get("/notes/", headers=headers)
+    assert response.content == cached
+
+
 @pytest.mark.asyncio
 async def test_encryption_at_rest(client: AsyncClient, session: AsyncSession):
     headers = await get_auth_headers(client)
@@ -170,17 +236,552 @@ async def test_encryption_at_rest(client: AsyncClient, session: AsyncSession):
     )
     assert create_res.status_code == 201
     note_id = create_res.json()["id"]
-    
+
+    # Flushing the request's session must not write the plaintext back
+    await session.flush()
     session.expire_all()
 
     statement = select(Note).where(Note.id == note_id)
     result = await session.exec(statement)
     db_note = result.first()
 
-    assert db_note.title != original_title
-    assert db_note.content != original_content
+    assert db_note.title == "" and db_note.content == ""
+    assert original_content.encode() not in db_note.content_enc
     
-    assert decrypt_text(db_note.title) == original_title
-    assert decrypt_text(db_note.content) == original_content
+    assert decrypt_bytes(db_note.title_enc) == original_title
+    assert decrypt_bytes(db_note.content_enc) == original_content
+
+    print(f"\n🔒 Encrypted DB Data: {db_note.content_enc[:15].hex()}...")
+
+
+@pytest.mark.asyncio
+async def test_legacy_fernet_notes_are_read_and_converted(client: AsyncClient, session: AsyncSession):
+    headers = await get_auth_headers(client)
+    owner_id = (await client.post(
+        "/notes/", json={"title": "New format", "content": "bytea", "is_public": False}, headers=headers,
+    )).json()["owner_id"]
+
+    legacy = Note(title=encrypt_text("Legacy title"), content=encrypt_text("Legacy content"), owner_id=owner_id)
+    session.add(legacy)
+    await session.commit()
+    legacy_id = legacy.id
+    await cache.invalidate(f"user_notes:{owner_id}")
+
+    items = (await client.get("/notes/", headers=headers)).json()["items"]
+    assert [(note["title"], note["content"]) for note in items] == [("New format", "bytea"), ("Legacy title", "Legacy content")]
+
+    # Reading decrypts into response rows, never onto the entity the session would flush back
+    await session.flush()
+    session.expire_all()
+    assert (await session.get(Note, legacy_id)).title != "Legacy title"
+
+    # Sealed with a key that isn't loaded: must be skipped, not re-sealed as plaintext
+    foreign_token = Fernet(Fernet.generate_key()).encrypt(b"Foreign").decode()
+    foreign = Note(title=foreign_token, content=foreign_token, owner_id=owner_id)
+    session.add(foreign)
+    await session.commit()
+    foreign_id = foreign.id
+
+    converted, last_id = await reencrypt.convert_batch(session, legacy_id - 1, 10)
+    assert converted == 1 and last_id == foreign_id
+    assert await reencrypt.convert_batch(session, last_id, 10) == (0, None)
+
+    session.expire_all()
+    db_note = await session.get(Note, legacy_id)
+    assert db_note.title == ""
+    assert decrypt_bytes(db_note.content_enc) == "Legacy content"
+
+    db_foreign = await session.get(Note, foreign_id)
+    assert db_foreign.title == foreign_token and db_foreign.title_enc is None
+
+@pytest.mark.asyncio
+async def test_undecryptable_notes_are_omitted_not_fatal(client: AsyncClient, session: AsyncSession):
+    headers = await get_auth_headers(client)
+    word = f"otter{uuid.uuid4().hex[:8]}"
+    notes = [
+        (await client.post("/notes/", json={"title": f"{word} {i}", "content": "...", "is_public": False}, headers=headers)).json()
+        for i in range(3)
+    ]
+    ids = [note["id"] for note in notes]
+
+    # One sealed with a key id that's no longer loaded, one truncated
+    retired = bytes([crypto.FORMAT_VERSION, 200]) + bytes(40)
+    await session.exec(update(Note).where(Note.id == ids[0]).values(title_enc=retired))
+    await session.exec(update(Note).where(Note.id == ids[1]).values(content_enc=b"\x01"))
+    await session.commit()
+    await cache.invalidate(f"user_notes:{notes[0]['owner_id']}")
+
+    response = await client.get("/notes/", headers=headers)
+    assert response.status_code == 200
+    assert [note["id"] for note in response.json()["items"]] == [ids[2]]
+
+    response = await client.get("/notes/search/private", params={"q": word}, headers=headers)
+    assert response.status_code == 200
+    assert [note["id"] for note in response.json()["items"]] == [ids[2]]
+
+    lines = (await client.get("/notes/export", headers=headers)).text.splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [ids[2]]
+
+
+@pytest.mark.asyncio
+async def test_key_rotation_reads_old_key_and_reencrypts(client: AsyncClient, session: AsyncSession):
+    headers = await get_auth_headers(client)
+    note = (await client.post(
+        "/notes/", json={"title": "Rotate me", "content": "old key", "is_public": False}, headers=headers,
+    )).json()
+
+    new_key = Fernet.generate_key().decode()
+    try:
+        crypto.load_keys(2, {settings.ENCRYPTION_KEY_ID: settings.ENCRYPTION_KEY, 2: new_key})
+        await cache.invalidate(f"user_notes:{note['owner_id']}")
+        items = (await client.get("/notes/", headers=headers)).json()["items"]
+        assert [item["title"] for item in items] == ["Rotate me"]
+
+        converted, last_id = await reencrypt.convert_batch(session, note["id"] - 1, 10)
+        assert converted == 1 and last_id == note["id"]
+
+        # The old key can go now
+        crypto.load_keys(2, {2: new_key})
+        session.expire_all()
+        db_note = await session.get(Note, note["id"])
+        assert db_note.title_enc[:crypto.HEADER_SIZE] == bytes([crypto.FORMAT_VERSION, 2])
+        assert crypto.decrypt_bytes(db_note.content_enc) == "old key"
+        assert await reencrypt.convert_batch(session, last_id - 1, 10) == (0, None)
+    finally:
+        crypto.load_keys(settings.ENCRYPTION_KEY_ID, settings.encryption_keys)
+
+
+@pytest.mark.asyncio
+async def test_search_ranks_title_matches_first(client: AsyncClient):
+    headers = await get_auth_headers(client)
+    unique_tag = f"ranktest{uuid.uuid4().hex}"
+
+    await client.post(
+        "/notes/",
+        json={"title": "Unrelated heading", "content": f"mentions {unique_tag} in the body", "is_public": True},
+        headers=headers,
+    )
+    await client.post(
+        "/notes/",
+        json={"title": f"{unique_tag} in the title", "content": "nothing else", "is_public": True},
+        headers=headers,
+    )
+    await client.post(
+        "/notes/",
+        json={"title": f"{unique_tag} private", "content": "...", "is_public": False},
+        headers=headers,
+    )
+
+    response = await client.get("/notes/search", params={"q": unique_tag}, headers=headers)
+    titles = [note["title"] for note in response.json()["items"]]
+    assert titles == [f"{unique_tag} in the title", "Unrelated heading"]
+
+
+@pytest.mark.asyncio
+async def test_batched_crypto_matches_inline(monkeypatch):
+    texts = [f"secret note {i} " * (i + 1) for i in range(50)]
+
+    inline_ciphertexts = await encrypt_many(texts[:2])
+    assert await decrypt_many(inline_ciphertexts) == texts[:2]
+
+    monkeypatch.setattr(settings, "CRYPTO_INLINE_MAX_ITEMS", 4)
+    pooled_ciphertexts = await encrypt_many(texts)
+    assert pooled_ciphertexts != texts
+    assert await decrypt_many(pooled_ciphertexts) == texts
+    assert [decrypt_bytes(c) for c in pooled_ciphertexts] == texts
+
+
+@pytest.mark.asyncio
+async def test_cache_coalesces_concurrent_misses():
+    key = f"stampede_test:{uuid.uuid4()}"
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return b"payload"
+
+    results = await asyncio.gather(*(cache.get_or_compute(key, 60, compute) for _ in range(20)))
+
+    assert results == [b"payload"] * 20
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_serves_stale_while_locked_elsewhere():
+    family = f"stale_test:{uuid.uuid4()}"
+    key = await cache.current_key(family)
+    redis = redis_client.get_redis_pool()
+
+    await cache.store(key, b"old", ttl=-1)
+    await redis.set(f"lock:{key}", "another-worker", px=5000)
+
+    async def compute():
+        raise AssertionError("must not rebuild while another worker holds the lock")
+
+    assert await cache.get_or_compute(family, 60, compute) == b"old"
+
+    await redis.delete(f"lock:{key}")
+
+    async def rebuild():
+        return b"new"
+
+    assert await cache.get_or_compute(family, 60, rebuild) == b"new"
+    assert cache_codec.decode(await redis.hget(key, "v")) == b"new"
+
 
-    print(f"\n🔒 Encrypted DB Data: {db_note.content[:15]}...")
\ No newline at end of file
+@pytest.mark.asyncio
+async def test_cached_feed_matches_uncached_response(client: AsyncClient):
+    headers = await get_auth_headers(client)
+    await client.post(
+        "/notes/",
+        json={"title": "Byte-for-byte", "content": "...", "is_public": True},
+        headers=headers,
+    )
+
+    miss = await client.get("/notes/public", headers=headers)
+    hit = await client.get("/notes/public", headers=headers)
+    uncached = await client.get("/notes/public", params={"limit": 10}, headers=headers)
+
+    assert hit.headers["content-type"] == "application/json"
+    assert hit.content == miss.content
+    assert hit.json()["items"][:10] == uncached.json()["items"]
+
+
+@pytest.mark.parametrize("compression", ["none", "zlib", "zstd"])
+def test_cache_codec_round_trip(monkeypatch, compression):
+    monkeypatch.setattr(settings, "CACHE_COMPRESSION", compression)
+    body = json.dumps({"items": [{"title": f"note {i}", "content": "x" * 100} for i in range(50)]}).encode()
+
+    encoded = cache_codec.encode(body)
+    assert encoded[0] == cache_codec.FORMAT_VERSION
+    assert cache_codec.decode(encoded) == body
+    if compression != "none":
+        assert len(encoded) < len(body)
+
+    small = b'{"items":[]}'
+    assert cache_codec.decode(cache_codec.encode(small)) == small
+    assert cache_codec.decode(bytes((cache_codec.FORMAT_VERSION + 1, 0)) + small) is None
+
+
+@pytest.mark.asyncio
+async def test_public_feed_served_from_local_cache(client: AsyncClient):
+    headers = await get_auth_headers(client)
+    redis = redis_client.get_redis_pool()
+
+    await client.post("/notes/", json={"title": "L1 note", "content": "...", "is_public": True}, headers=headers)
+    first = await client.get("/notes/public", headers=headers)
+
+    # Served from process memory even if the Redis entry disappears
+    await redis.delete(await cache.current_key("public_notes_feed"))
+    second = await client.get("/notes/public", headers=headers)
+    assert second.content == first.content
+
+    # Another worker bumping the generation reaches us through pub/sub
+    listener = asyncio.create_task(invalidation.listen())
+    while (await redis.pubsub_numsub(cache.INVALIDATION_CHANNEL))[0][1] == 0:
+        await asyncio.sleep(0.01)
+
+    await redis.publish(cache.INVALIDATION_CHANNEL, "public_notes_feed")
+    for _ in range(100):
+        if cache.l1.get("public_notes_feed") is None:
+            break
+        await asyncio.sleep(0.01)
+
+    listener.cancel()
+    assert cache.l1.get("public_notes_feed") is None
+
+    # Private writes only touch per-user families, which never live in the L1
+    version = cache.l1.version
+    await client.post("/notes/", json={"title": "Private", "content": "...", "is_public": False}, headers=headers)
+    assert cache.l1.version == version
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_notes(client: AsyncClient, session: AsyncSession):
+    headers = await get_auth_headers(client)
+
+    payload = [
+        {"title": "Bulk private", "content": "secret", "is_public": False},
+        {"title": "Bulk public", "content": "hello", "is_public": True},
+        {"title": "Missing content"},
+        {"title": "Bulk private 2", "content": "secret 2"},
+        "not an object",
+    ]
+    response = await client.post("/notes/bulk", json=payload, headers=headers)
+
+    assert response.status_code == 201
+    data = response.json()
+    assert [note["title"] for note in data["created"]] == ["Bulk private", "Bulk public", "Bulk private 2"]
+    assert [note["index"] for note in data["created"]] == [0, 1, 3]
+    assert [error["index"] for error in data["errors"]] == [2, 4]
+    assert "content" in data["errors"][0]["detail"]
+    assert data["errors"][1]["detail"].startswith("Input should be")
+
+    schema = (await client.get("/openapi.json")).json()["paths"]["/notes/bulk"]["post"]["requestBody"]
+    assert schema["content"]["application/json"]["schema"]["items"] == {"$ref": "#/components/schemas/NoteCreate"}
+
+    session.expire_all()
+    db_note = (await session.exec(select(Note).where(Note.id == data["created"][0]["id"]))).first()
+    assert db_note.title == ""
+    assert decrypt_bytes(db_note.title_enc) == "Bulk private"
+
+    my_notes = (await client.get("/notes/", headers=headers)).json()["items"]
+    assert [note["title"] for note in my_notes] == ["Bulk private", "Bulk public", "Bulk private 2"]
+
+    too_many = await client.post("/notes/bulk", json=[payload[0]] * 1001, headers=headers)
+    assert too_many.status_code == 413
+
+
+@pytest.mark.asyncio
+async def test_export_notes(client: AsyncClient):
+    headers = await get_auth_headers(client)
+    await client.post("/notes/", json={"title": "Private", "content": "secret", "is_public": False}, headers=headers)
+    await client.post("/notes/", json={"title": "Public", "content": "hello", "is_public": True}, headers=headers)
+
+    other_headers = await get_auth_headers(client)
+    await client.post("/notes/", json={"title": "Not mine", "content": "x"}, headers=other_headers)
+
+    response = await client.get("/notes/export", headers=headers)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [(note["title"], note["content"]) for note in lines] == [("Private", "secret"), ("Public", "hello")]
+
+
+@pytest.mark.asyncio
+async def test_export_memory_is_bounded(session: AsyncSession):
+    async def export_peak(count: int) -> int:
+        owner_id = (await session.exec(text(
+            """INSERT INTO "user" (username, email, is_active, is_admin, hashed_password)
+               VALUES (:name, :email, true, false, '') RETURNING id"""
+        ).bindparams(name=f"export_{uuid.uuid4()}", email=f"export_{uuid.uuid4()}@example.com"))).scalar_one()
+        await session.exec(text(
+            """INSERT INTO note (title, content, is_public, owner_id)
+               SELECT 'note ' || i, repeat('x', 500), i % 2 = 0, :owner_id FROM generate_series(1, :n) AS i"""
+        ).bindparams(owner_id=owner_id, n=count))
+
+        tracemalloc.start()
+        exported = 0
+        async for chunk in crud.stream_notes_by_owner(session, owner_id, chunk_size=500):
+            exported += len(chunk)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        assert exported == count
+        return peak
+
+    small = await export_peak(2_000)
+    large = await export_peak(20_000)
+
+    # 10x the rows must not mean 10x the memory
+    assert large < small * 2
+
+
+@pytest.mark.asyncio
+async def test_public_feed_is_newest_first(client: AsyncClient, session: AsyncSession):
+    headers = await get_auth_headers(client)
+    ids = []
+    for title in ("First", "Second", "Third"):
+        response = await client.post("/notes/", json={"title": title, "content": "x", "is_public": True}, headers=headers)
+        ids.append(response.json()["id"])
+
+    # Ordered by created_at, not id
+    first = (await session.exec(select(Note).where(Note.id == ids[0]))).first()
+    await session.exec(update(Note).where(Note.id == ids[0]).values(created_at=first.created_at + timedelta(days=1)))
+    await session.commit()
+
+    page = (await client.get("/notes/public", params={"limit": 2}, headers=headers)).json()
+    assert [note["title"] for note in page["items"]] == ["First", "Third"]
+    assert page["items"][0]["created_at"] > page["items"][1]["created_at"]
+
+    rest = (await client.get("/notes/public", params={"limit": 2, "cursor": page["next_cursor"]}, headers=headers)).json()
+    assert rest["items"][0]["title"] == "Second"
+
+    bad = await client.get("/notes/public", params={"cursor": "WyJub3QtYS1kYXRlIiwxXQ"}, headers=headers)
+    assert bad.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_reads_go_to_replica_unless_pinned(client: AsyncClient, monkeypatch):
+    # Stand-in replica: a separate connection to the same database. It can't see the
+    # test's uncommitted transaction, which is exactly what replication lag looks like.
+    replica = create_async_engine(settings.DATABASE_URL, poolclass=NullPool)
+    monkeypatch.setattr(database, "replica_engines", [replica])
+
+    headers = await get_auth_headers(client)
+    await client.post("/notes/", json={"title": "Fresh", "content": "x"}, headers=headers)
+
+    # Just wrote: served by the primary
+    pinned = (await client.get("/notes/", params={"limit": 10}, headers=headers)).json()
+    assert [note["title"] for note in pinned["items"]] == ["Fresh"]
+
+    redis = redis_client.get_redis_pool()
+    await redis.delete(*[key async for key in redis.scan_iter(match="primary_pin:*")])
+
+    lagging = (await client.get("/notes/", params={"limit": 10}, headers=headers)).json()
+    assert lagging["items"] == []
+
+    await replica.dispose()
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(client: AsyncClient):
+    headers = await get_auth_headers(client)
+    await client.get("/notes/public", headers=headers)
+    await client.get("/notes/public", headers=headers)
+
+    response = await client.get("/metrics")
+
+    assert response.status_code == 200
+    body = response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/notes/public",status="200"}' in body
+    assert 'cache_requests_total{family="public_notes_feed",result="miss"}' in body
+    assert 'cache_requests_total{family="public_notes_feed",result="local_hit"}' in body
+    assert 'db_queries_per_request_bucket{le="1.0",route="/notes/public"}' in body
+    assert 'password_hash_duration_seconds_count{operation="verify"}' in body
+    assert 'local_cache_hits_total{cache="public_feed_l1"}' in body
+
+
+@pytest.mark.asyncio
+async def test_slow_query_and_n_plus_one_logging(client: AsyncClient, monkeypatch, caplog):
+    headers = await get_auth_headers(client)
+
+    monkeypatch.setattr(settings, "SLOW_QUERY_MS", 0)
+    monkeypatch.setattr(settings, "N_PLUS_ONE_THRESHOLD", 0)
+    caplog.clear()
+
+    with caplog.at_level("WARNING", logger="uvicorn"):
+        await client.get("/notes/", params={"limit": 10}, headers=headers)
+
+    events = [json.loads(record.getMessage()) for record in caplog.records if record.getMessage().startswith("{")]
+    slow = [event for event in events if event["event"] == "slow_query"]
+    assert slow and all(event["route"] == "/notes/" for event in slow)
+    assert any("FROM note" in event["statement"] for event in slow)
+
+    flagged = [event for event in events if event["event"] == "n_plus_one"]
+    assert flagged[0]["route"] == "/notes/"
+    assert flagged[0]["query_count"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_search_is_rate_limited_per_user(client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(settings, "SEARCH_BURST", 3)
+    monkeypatch.setattr(settings, "SEARCH_RATE_PER_MINUTE", 1)
+
+    headers = await get_auth_headers(client)
+    statuses = [(await client.get("/notes/search", params={"q": "x"}, headers=headers)).status_code for _ in range(4)]
+    assert statuses == [200, 200, 200, 429]
+
+
+@pytest.mark.asyncio
+async def test_private_search_uses_blind_index(client: AsyncClient, session: AsyncSession):
+    headers = await get_auth_headers(client)
+    other_headers = await get_auth_headers(client)
+    word = f"zebra{uuid.uuid4().hex[:8]}"
+
+    await client.post("/notes/", json={"title": f"{word.upper()} trip", "content": "Pack tent", "is_public": False}, headers=headers)
+    await client.post("/notes/bulk", json=[
+        {"title": "Shopping", "content": f"{word} food, tent pegs", "is_public": False},
+        {"title": f"Public {word}", "content": "visible", "is_public": True},
+    ], headers=headers)
+    await client.post("/notes/", json={"title": word, "content": "tent", "is_public": False}, headers=other_headers)
+
+    response = await client.get("/notes/search/private", params={"q": word}, headers=headers)
+    assert [note["title"] for note in response.json()["items"]] == ["Shopping", f"{word.upper()} trip"]
+
+    response = await client.get("/notes/search/private", params={"q": f"{word} TRIP"}, headers=headers)
+    assert [note["title"] for note in response.json()["items"]] == [f"{word.upper()} trip"]
+
+    page = (await client.get("/notes/search/private", params={"q": word, "limit": 1}, headers=headers)).json()
+    rest = (await client.get("/notes/search/private", params={"q": word, "cursor": page["next_cursor"]}, headers=headers)).json()
+    assert [note["title"] for note in page["items"] + rest["items"]] == ["Shopping", f"{word.upper()} trip"]
+
+    # Tokens reveal nothing about the words and differ between owners
+    tokens = (await session.exec(select(NoteSearchToken.tokens))).all()
+    assert all(word not in token for note_tokens in tokens for token in note_tokens)
+    assert crypto.search_tokens(1, word) != crypto.search_tokens(2, word)
+
+    # Notes written before the index existed are picked up by the backfill
+    note_id = response.json()["items"][0]["id"]
+    await session.exec(NoteSearchToken.__table__.delete().where(NoteSearchToken.note_id == note_id))
+    assert (await client.get("/notes/search/private", params={"q": "trip"}, headers=headers)).json()["items"] == []
+    indexed, _ = await search_index.index_batch(session, note_id - 1, 1)
+    assert indexed == 1
+    assert len((await client.get("/notes/search/private", params={"q": "trip"}, headers=headers)).json()["items"]) == 1
+
+    # After a key change, tokens made with the old key are rebuilt, not skipped
+    old_key = (crypto.search_index_key, crypto.search_index_key_id)
+    try:
+        crypto.load_search_key(b"rotated blind index key")
+        assert (await client.get("/notes/search/private", params={"q": "trip"}, headers=headers)).json()["items"] == []
+        indexed, _ = await search_index.index_batch(session, note_id - 1, 1)
+        assert indexed == 1
+        assert len((await client.get("/notes/search/private", params={"q": "trip"}, headers=headers)).json()["items"]) == 1
+        # Rebuilt once: the next batch moves on to the following note
+        _, last_id = await search_index.index_batch(session, note_id - 1, 1)
+        assert last_id != note_id
+    finally:
+        crypto.search_index_key, crypto.search_index_key_id = old_key
+
+
+@pytest.mark.asyncio
+async def test_search_index_skips_undecryptable_notes(client: AsyncClient, session: AsyncSession):
+    headers = await get_auth_headers(client)
+    owner_id = (await client.post(
+        "/notes/", json={"title": "Readable", "content": "...", "is_public": False}, headers=headers,
+    )).json()["owner_id"]
+
+    foreign_token = Fernet(Fernet.generate_key()).encrypt(b"Foreign").decode()
+    retired = bytes([crypto.FORMAT_VERSION, 200]) + bytes(40)
+    unreadable = [
+        Note(title=foreign_token, content=foreign_token, owner_id=owner_id),
+        Note(title="", content="", title_enc=retired, content_enc=retired, owner_id=owner_id),
+    ]
+    session.add_all(unreadable)
+    await session.commit()
+    first_id = unreadable[0].id
+
+    indexed, last_id = await search_index.index_batch(session, first_id - 1, 10)
+    assert indexed == 0 and last_id == unreadable[1].id
+    tokens = await session.exec(select(NoteSearchToken).where(NoteSearchToken.note_id.in_([note.id for note in unreadable])))
+    assert tokens.all() == []
+
+
+@pytest.mark.asyncio
+async def test_search_results_cached_until_public_write(client: AsyncClient, monkeypatch):
+    headers = await get_auth_headers(client)
+    tag = f"cachetag{uuid.uuid4().hex}"
+    await client.post("/notes/", json={"title": f"{tag} one", "content": "first", "is_public": True}, headers=headers)
+
+    calls = 0
+    search_notes = crud.search_notes
+
+    async def counting_search(*args, **kwargs):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return await search_notes(*args, **kwargs)
+
+    monkeypatch.setattr(crud, "search_notes", counting_search)
+
+    # Identical searches in flight at once share one query, spelling variants share the entry
+    responses = await asyncio.gather(*(
+        client.get("/notes/search", params={"q": query}, headers=headers)
+        for query in [tag, f"  {tag.upper()} ", tag, tag]
+    ))
+    assert calls == 1
+    assert all(response.json() == responses[0].json() for response in responses)
+    assert len(responses[0].json()["items"]) == 1
+
+    # Private notes don't touch public results
+    await client.post("/notes/", json={"title": f"{tag} secret", "content": "x", "is_public": False}, headers=headers)
+    await client.get("/notes/search", params={"q": tag}, headers=headers)
+    assert calls == 1
+
+    await client.post("/notes/", json={"title": f"{tag} two", "content": "second", "is_public": True}, headers=headers)
+    response = await client.get("/notes/search", params={"q": tag}, headers=headers)
+    assert calls == 2
+    assert len(response.json()["items"]) == 2